@@ -0,0 +1,137 @@
+"""Product catalog: maps a device pid to its model, type and dpid list."""
+
+import asyncio
+import json
+import logging
+import os
+from typing import NamedTuple, Optional
+
+try:
+    from .utils import get_pid_list
+except ImportError:
+    from utils import get_pid_list
+
+_LOGGER = logging.getLogger(__name__)
+
+# Snapshot of http://doc.doit/project-12/doc-95/ shipped with the integration
+MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.json")
+
+
+class PidInfo(NamedTuple):
+    device_type_code: str
+    device_model_name: str
+    icon: str
+    dpid: list
+
+
+# pid -> PidInfo, built once per process
+_PID_INDEX: Optional[dict] = None
+_load_future: Optional[asyncio.Future] = None
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def build_pid_index(pid_list: list) -> dict:
+    """
+    Flatten the device_type/device_model tree into a pid keyed dict
+    :param pid_list: info.list of the model api response
+    :return: dict[str, PidInfo]
+    """
+    index = {}
+    for item in pid_list:
+        type_code = item.get("device_type_code")
+        for model in item.get("device_model") or []:
+            pid = model.get("device_product_id")
+            if pid is None:
+                continue
+            index[pid] = PidInfo(
+                type_code,
+                model.get("device_model_name"),
+                model.get("icon"),
+                model.get("dpid") or [],
+            )
+    return index
+
+
+def load_bundled_pid_list(path: str = MODEL_FILE) -> list:
+    """
+    Read the bundled model.json (blocking, run it in an executor)
+    :return: list, [] if the file is missing or malformed
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+    except (OSError, ValueError) as e:
+        _LOGGER.warning("Unable to read bundled model list %s: %s", path, e)
+        return []
+
+    info = data.get("info") if isinstance(data, dict) else None
+    if not isinstance(info, dict) or not isinstance(info.get("list"), list):
+        _LOGGER.warning("Bundled model list %s has unexpected structure", path)
+        return []
+    return info["list"]
+
+
+async def async_get_pid_index() -> dict:
+    """
+    Return the pid index, loading model.json off the event loop on first use
+    :return: dict[str, PidInfo]
+    """
+    global _PID_INDEX, _load_future
+    if _PID_INDEX is not None:
+        return _PID_INDEX
+
+    loop = asyncio.get_running_loop()
+    # single flight: concurrent first callers share one executor job
+    if _load_future is None or _load_future.get_loop() is not loop:
+        _load_future = loop.run_in_executor(
+            None, lambda: build_pid_index(load_bundled_pid_list())
+        )
+    index = await asyncio.shield(_load_future)
+    if _PID_INDEX is None:
+        _PID_INDEX = index
+    return _PID_INDEX
+
+
+async def async_lookup_pid(pid: str) -> Optional[PidInfo]:
+    """
+    O(1) lookup of a pid, never touches the network
+    :param pid:
+    :return: PidInfo or None when the pid is unknown
+    """
+    if pid is None:
+        return None
+    index = await async_get_pid_index()
+    return index.get(pid)
+
+
+async def async_refresh_from_cloud(lang: str = "en") -> bool:
+    """
+    Merge the cloud model list into the index
+    :param lang:
+    :return: True if the cloud returned a usable list
+    """
+    global _PID_INDEX
+    pid_list = await get_pid_list(lang)
+    if not pid_list:
+        return False
+    index = await async_get_pid_index()
+    # build a new dict so readers never see a half updated index
+    _PID_INDEX = {**index, **build_pid_index(pid_list)}
+    _LOGGER.debug("pid index refreshed from cloud, %d models", len(_PID_INDEX))
+    return True
+
+
+def async_schedule_cloud_refresh(lang: str = "en") -> asyncio.Task:
+    """
+    Refresh the index from the cloud in the background, at most one run at a time
+    :param lang:
+    :return: the refresh task
+    """
+    global _refresh_task
+    if (
+        _refresh_task is None
+        or _refresh_task.done()
+        or _refresh_task.get_loop() is not asyncio.get_running_loop()
+    ):
+        _refresh_task = asyncio.create_task(async_refresh_from_cloud(lang))
+    return _refresh_task
@@ -0,0 +1,133 @@
+"""Lookup tables between device registers and Home Assistant colour attributes."""
+
+import colorsys
+import math
+from functools import lru_cache
+from typing import Optional
+
+# colour temperature range of the bulbs
+MIN_KELVIN = 2700
+MAX_KELVIN = 6500
+# same rounding as homeassistant.util.color.color_temperature_kelvin_to_mired
+MIN_MIREDS = math.floor(1000000 / MAX_KELVIN)
+MAX_MIREDS = math.floor(1000000 / MIN_KELVIN)
+# mireds per step of register '3' (0..1000, 1000 is coldest)
+MIREDS_RATIO = (MAX_MIREDS - MIN_MIREDS) / 1000
+
+# device scale of brightness ('4') and colour temperature ('3')
+DEVICE_MAX = 1000
+# register values at or above this mean "not in this mode" (0xFFFF)
+DEVICE_UNSET = 60000
+
+
+def _hs_to_rgb(hue: float, sat: float) -> tuple:
+    """homeassistant.util.color.color_hs_to_RGB"""
+    return tuple(
+        int(round(x * 255)) for x in colorsys.hsv_to_rgb(hue / 360, sat / 100, 1.0)
+    )
+
+
+def _rgb_to_hs(r: int, g: int, b: int) -> tuple:
+    """homeassistant.util.color.color_RGB_to_hs"""
+    h, s, _ = colorsys.rgb_to_hsv(r / 255, g / 255, b / 255)
+    return round(h * 360, 3), round(s * 100, 3)
+
+
+# built once per process, shared by all lights
+# register '4' -> HA brightness 0..255
+_BRIGHTNESS_FROM_DEVICE = [int(v / DEVICE_MAX * 255) for v in range(DEVICE_MAX + 1)]
+# HA brightness -> register '4'
+_BRIGHTNESS_TO_DEVICE = [round(b / 255 * DEVICE_MAX) for b in range(256)]
+# register '3' -> mireds
+_MIREDS_FROM_DEVICE = [
+    round(MAX_MIREDS - v * MIREDS_RATIO) for v in range(DEVICE_MAX + 1)
+]
+# mireds - MIN_MIREDS -> register '3'
+_MIREDS_TO_DEVICE = [
+    DEVICE_MAX - round((m - MIN_MIREDS) / MIREDS_RATIO)
+    for m in range(MIN_MIREDS, MAX_MIREDS + 1)
+]
+# kelvin - MIN_KELVIN -> mireds
+_KELVIN_TO_MIREDS = [math.floor(1000000 / k) for k in range(MIN_KELVIN, MAX_KELVIN + 1)]
+# hue register -> list of HA hs colours indexed by saturation register / 10,
+# rows are filled on first use
+_HS_FROM_DEVICE: list = [None] * 361
+
+
+def brightness_from_device(value: int) -> int:
+    """
+    :param value: register '4', 0..1000
+    :return: HA brightness 0..255
+    """
+    if isinstance(value, int) and 0 <= value <= DEVICE_MAX:
+        return _BRIGHTNESS_FROM_DEVICE[value]
+    return int(value / DEVICE_MAX * 255)
+
+
+def brightness_to_device(brightness: int) -> int:
+    """
+    :param brightness: HA brightness 0..255
+    :return: register '4', 0..1000
+    """
+    if isinstance(brightness, int) and 0 <= brightness <= 255:
+        return _BRIGHTNESS_TO_DEVICE[brightness]
+    return round(brightness / 255 * DEVICE_MAX)
+
+
+def mireds_from_device(value: int) -> Optional[int]:
+    """
+    :param value: register '3', 0..1000
+    :return: mireds, None if the device is not in white mode
+    """
+    if isinstance(value, int) and 0 <= value <= DEVICE_MAX:
+        return _MIREDS_FROM_DEVICE[value]
+    if value >= DEVICE_UNSET:
+        return None
+    return round(MAX_MIREDS - value * MIREDS_RATIO)
+
+
+def mireds_to_device(mireds: int) -> int:
+    """
+    :param mireds: colour temperature
+    :return: register '3', 0..1000 inside the bulb's range
+    """
+    if isinstance(mireds, int) and MIN_MIREDS <= mireds <= MAX_MIREDS:
+        return _MIREDS_TO_DEVICE[mireds - MIN_MIREDS]
+    return DEVICE_MAX - round((mireds - MIN_MIREDS) / MIREDS_RATIO)
+
+
+def kelvin_to_mireds(kelvin: int) -> int:
+    """homeassistant.util.color.color_temperature_kelvin_to_mired"""
+    if isinstance(kelvin, int) and MIN_KELVIN <= kelvin <= MAX_KELVIN:
+        return _KELVIN_TO_MIREDS[kelvin - MIN_KELVIN]
+    return math.floor(1000000 / kelvin)
+
+
+def hs_from_device(hue: int, sat: int) -> tuple:
+    """
+    :param hue: register '5', 0..360
+    :param sat: register '6', 0..1000
+    :return: HA hs colour, balanced through RGB like the app does
+    """
+    hue = round(hue)
+    sat = round(sat / 10)
+    if not (0 <= hue <= 360 and 0 <= sat <= 100):
+        return _rgb_to_hs(*_hs_to_rgb(hue, sat))
+    row = _HS_FROM_DEVICE[hue]
+    if row is None:
+        row = _HS_FROM_DEVICE[hue] = [
+            _rgb_to_hs(*_hs_to_rgb(hue, s)) for s in range(101)
+        ]
+    return row[sat]
+
+
+@lru_cache(maxsize=4096)
+def hs_to_device(hue: float, sat: float) -> tuple:
+    """
+    :param hue: HA hue 0..360
+    :param sat: HA saturation 0..100
+    :return: registers '5' and '6'
+    """
+    # the colour is not balanced right, going through RGB gets closer
+    h, s = _rgb_to_hs(*_hs_to_rgb(hue, sat))
+    return round(h), round(s * 10)
@@ -0,0 +1,224 @@
+"""One heartbeat loop keeping the connections of all devices alive."""
+
+import asyncio
+import logging
+import math
+import random
+import time
+from typing import Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# seconds between two liveness checks of a device
+HEARTBEAT_INTERVAL = 30.0
+# checks are spread by +-this fraction of their delay
+HEARTBEAT_JITTER = 0.2
+# retry delay after a failed reconnect while the breaker is still closed (seconds)
+RECONNECT_BACKOFF_MIN = 5.0
+# failed connects in a row that open a device's circuit breaker
+BREAKER_FAILURE_THRESHOLD = 3
+# how long an opened breaker stays open, doubled per failed probe up to the max
+BREAKER_BACKOFF_MIN = 10.0
+BREAKER_BACKOFF_MAX = 600.0
+# reconnects in flight at the same time, e.g. after the access point rebooted
+MAX_PARALLEL_RECONNECTS = 4
+
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Per-device guard against connecting to a device that is gone.
+
+    closed: connects are attempted, consecutive failures are counted.
+    open: after failure_threshold failures every connect fails fast until
+    the backoff has elapsed.
+    half_open: a single probe may connect; success closes the breaker,
+    failure opens it again with the backoff doubled.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        backoff_min: float = BREAKER_BACKOFF_MIN,
+        backoff_max: float = BREAKER_BACKOFF_MAX,
+    ) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.backoff_min = backoff_min
+        self.backoff_max = max(backoff_min, backoff_max)
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self._backoff = backoff_min
+        # time.monotonic() a probe is allowed again
+        self._open_until = 0.0
+
+    @property
+    def closed(self) -> bool:
+        return self.state == BREAKER_CLOSED
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        """
+        :param now: time.monotonic()
+        :return: True if a connect may be attempted now
+        """
+        if self.state == BREAKER_CLOSED:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.state == BREAKER_OPEN and now >= self._open_until:
+            # let exactly one probe through
+            self.state = BREAKER_HALF_OPEN
+            return True
+        return False
+
+    def retry_in(self, now: Optional[float] = None) -> float:
+        """
+        :param now: time.monotonic()
+        :return: seconds until allow() lets a probe through, 0 when closed
+        """
+        if self.state != BREAKER_OPEN:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._open_until - now)
+
+    def record_success(self) -> None:
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self._backoff = self.backoff_min
+
+    def record_failure(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self.failures += 1
+        if self.state == BREAKER_HALF_OPEN:
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+        elif self.failures < self.failure_threshold:
+            return
+        self.state = BREAKER_OPEN
+        self._open_until = now + self._backoff
+
+
+class ConnectionManager:
+    """
+    Owns the heartbeat of every registered tcp_client.
+
+    A single task wakes up when the next device is due instead of one sleeping
+    task per device. A device that sent anything within the interval is not
+    pinged. A dead connection is reopened through the device's CircuitBreaker,
+    so a device that is gone is only probed with exponential backoff, and
+    only a few reconnects run at once.
+    """
+
+    def __init__(
+        self,
+        interval: float = HEARTBEAT_INTERVAL,
+        jitter: float = HEARTBEAT_JITTER,
+        backoff_min: float = RECONNECT_BACKOFF_MIN,
+        max_reconnects: int = MAX_PARALLEL_RECONNECTS,
+    ) -> None:
+        self.interval = interval
+        self.jitter = jitter
+        self.backoff_min = backoff_min
+        self._reconnects = asyncio.Semaphore(max(1, max_reconnects))
+        # client -> time.monotonic() its next check is due, inf while checking
+        self._due_at: dict = {}
+        self._checks: set = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._loop = asyncio.get_running_loop()
+
+    def __contains__(self, client) -> bool:
+        return client in self._due_at
+
+    def register(self, client) -> None:
+        """Start checking a client, no-op if it is registered already."""
+        if client in self._due_at:
+            return
+        self._due_at[client] = time.monotonic() + self._jittered(self.interval)
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def unregister(self, client) -> None:
+        self._due_at.pop(client, None)
+        self._wakeup.set()
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _run(self) -> None:
+        while self._due_at:
+            now = time.monotonic()
+            for client, due_at in list(self._due_at.items()):
+                if due_at <= now:
+                    self._due_at[client] = math.inf
+                    task = asyncio.create_task(self._check(client))
+                    self._checks.add(task)
+                    task.add_done_callback(self._checks.discard)
+            next_due = min(self._due_at.values(), default=math.inf)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    None if next_due == math.inf else max(0, next_due - now),
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, client) -> None:
+        ok = False
+        try:
+            if client.available:
+                if time.monotonic() - client.last_activity < self.interval:
+                    # the device talked to us recently, no need to ask
+                    ok = True
+                else:
+                    try:
+                        await client._ping()
+                        ok = True
+                    except Exception as e:
+                        client.metrics.heartbeat_failures += 1
+                        _LOGGER.info(
+                            "Heartbeat: ping failed for %s (%s), reconnecting",
+                            client._ip,
+                            e,
+                        )
+                        await client._close_connection()
+            if not ok:
+                ok = await self._reconnect(client)
+        finally:
+            if client in self._due_at:
+                if ok:
+                    delay = self.interval
+                else:
+                    # an open breaker knows when the next probe is allowed
+                    delay = max(self.backoff_min, client.breaker.retry_in())
+                self._due_at[client] = time.monotonic() + self._jittered(delay)
+                self._wakeup.set()
+
+    async def _reconnect(self, client) -> bool:
+        if client.breaker.retry_in() > 0:
+            return False
+        async with self._reconnects:
+            if client not in self._due_at:
+                return False
+            if await client._ensure_connected():
+                _LOGGER.info("Heartbeat: reconnected to %s", client._ip)
+                return True
+        _LOGGER.info("Heartbeat: %s still unreachable", client._ip)
+        return False
+
+
+_MANAGER: Optional[ConnectionManager] = None
+
+
+def get_connection_manager() -> ConnectionManager:
+    """
+    The process wide manager of the running event loop
+    :return: ConnectionManager
+    """
+    global _MANAGER
+    if _MANAGER is None or _MANAGER._loop is not asyncio.get_running_loop():
+        _MANAGER = ConnectionManager()
+    return _MANAGER
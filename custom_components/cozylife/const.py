@@ -1,5 +1,14 @@
 DOMAIN = "cozylife"
 
+# Store key of the cached cloud model list
+PID_CACHE_STORAGE_KEY = f"{DOMAIN}.pid_list"
+
+# platform options
+CONF_POLL_CONCURRENCY = "poll_concurrency"
+CONF_POLL_TIMEOUT = "poll_timeout"
+CONF_POLL_INTERVAL_MIN = "poll_interval_min"
+CONF_POLL_INTERVAL_MAX = "poll_interval_max"
+
 # http://doc.doit/project-5/doc-8/
 SWITCH_TYPE_CODE = "00"
 LIGHT_TYPE_CODE = "01"
@@ -0,0 +1,93 @@
+"""Per-device logging for the protocol and entity hot paths, formatted only when shown."""
+
+import logging
+from typing import Optional
+
+# with debug on, one frame out of this many is logged per device
+DEFAULT_FRAME_SAMPLE = 20
+
+# ip or did -> frame sample rate of devices debugged at INFO level
+_DEBUG_DEVICES: dict = {}
+
+
+def set_device_debug(
+    key: str, enabled: bool = True, sample: int = DEFAULT_FRAME_SAMPLE
+) -> None:
+    """
+    Log the debug messages and sampled frames of one device without turning on
+    debug for the whole integration
+    :param key: ip or did of the device
+    :param enabled:
+    :param sample: log one frame out of sample, 1 logs every frame
+    """
+    if enabled:
+        _DEBUG_DEVICES[key] = max(1, int(sample))
+    else:
+        _DEBUG_DEVICES.pop(key, None)
+
+
+def debugged_devices() -> dict:
+    return dict(_DEBUG_DEVICES)
+
+
+class DeviceLogger:
+    """
+    Logger of one device, prefixing messages with its ip.
+
+    Arguments are passed through to logging unformatted, so a disabled
+    message costs a level check. Devices switched on with set_device_debug
+    have their debug messages emitted at INFO, the level production runs at.
+    """
+
+    __slots__ = ("_logger", "ip", "did", "_frames")
+
+    def __init__(self, logger: logging.Logger, ip: str) -> None:
+        self._logger = logger
+        self.ip = ip
+        # set once the device answered CMD_INFO
+        self.did: Optional[str] = None
+        self._frames = 0
+
+    def _debug_level(self) -> int:
+        """
+        :return: level debug messages of the device go out at, 0 if not shown
+        """
+        if _DEBUG_DEVICES and (self.ip in _DEBUG_DEVICES or self.did in _DEBUG_DEVICES):
+            return logging.INFO
+        if self._logger.isEnabledFor(logging.DEBUG):
+            return logging.DEBUG
+        return 0
+
+    @property
+    def debug_enabled(self) -> bool:
+        return self._debug_level() != 0
+
+    def debug(self, msg: str, *args) -> None:
+        level = self._debug_level()
+        if level:
+            self._logger.log(level, "%s: " + msg, self.ip, *args)
+
+    def info(self, msg: str, *args) -> None:
+        self._logger.info("%s: " + msg, self.ip, *args)
+
+    def warning(self, msg: str, *args) -> None:
+        self._logger.warning("%s: " + msg, self.ip, *args)
+
+    def frame(self, direction: str, frame) -> None:
+        """
+        Log a sample of the frames exchanged with the device
+        :param direction: '<-' received, '->' sent
+        :param frame: decoded dict or raw bytes, only formatted when logged
+        """
+        level = self._debug_level()
+        if not level:
+            return
+        self._frames += 1
+        sample = _DEBUG_DEVICES.get(self.ip) or _DEBUG_DEVICES.get(self.did)
+        if sample is None:
+            sample = DEFAULT_FRAME_SAMPLE
+        if (self._frames - 1) % sample:
+            return
+        self._logger.log(
+            level, "%s %s frame #%d: %s", self.ip, direction, self._frames, frame
+        )
@@ -4,7 +4,6 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import time
 from datetime import timedelta
 from typing import Any
 
@@ -21,16 +20,49 @@ from homeassistant.components.light import (
     LightEntity,
     LightEntityFeature,
 )
-from homeassistant.const import CONF_EFFECT
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.const import CONF_EFFECT, EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import Event, HomeAssistant, ServiceCall, callback
 from homeassistant.helpers import entity_platform
 from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.helpers.restore_state import RestoreEntity
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 from homeassistant.util import color as colorutil
 
-from .const import DOMAIN
+from .colors import (
+    DEVICE_UNSET,
+    MAX_MIREDS,
+    MIN_MIREDS,
+    brightness_from_device,
+    brightness_to_device,
+    hs_from_device,
+    hs_to_device,
+    kelvin_to_mireds,
+    mireds_from_device,
+    mireds_to_device,
+)
+from .const import (
+    CONF_POLL_CONCURRENCY,
+    CONF_POLL_INTERVAL_MAX,
+    CONF_POLL_INTERVAL_MIN,
+    CONF_POLL_TIMEOUT,
+    DOMAIN,
+    PID_CACHE_STORAGE_KEY,
+)
+from .poller import (
+    DEFAULT_POLL_CONCURRENCY,
+    DEFAULT_POLL_INTERVAL_MAX,
+    DEFAULT_POLL_INTERVAL_MIN,
+    DEFAULT_POLL_TIMEOUT,
+    AdaptivePollSchedule,
+    async_poll_all,
+)
+from .registry import acquire_client, release_client
+from .services import async_register_services
+from .state import DiffWriteMixin
 from .tcp_client import tcp_client
+from .transition import TransitionCoordinator, TransitionEngine
+from .utils import PID_LIST_STORAGE_VERSION, pid_cache_store, set_pid_cache_store
 
 LIGHT_SCHEMA = vol.Schema(
     {
@@ -48,13 +80,24 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
         vol.Optional("lights", default=[]): vol.All(cv.ensure_list, [LIGHT_SCHEMA]),
         vol.Optional("optimistic", default=False): cv.boolean,
+        vol.Optional(
+            CONF_POLL_CONCURRENCY, default=DEFAULT_POLL_CONCURRENCY
+        ): cv.positive_int,
+        vol.Optional(CONF_POLL_TIMEOUT, default=DEFAULT_POLL_TIMEOUT): vol.All(
+            vol.Coerce(float), vol.Range(min=0.1)
+        ),
+        vol.Optional(
+            CONF_POLL_INTERVAL_MIN, default=DEFAULT_POLL_INTERVAL_MIN
+        ): vol.All(vol.Coerce(float), vol.Range(min=1)),
+        vol.Optional(
+            CONF_POLL_INTERVAL_MAX, default=DEFAULT_POLL_INTERVAL_MAX
+        ): vol.All(vol.Coerce(float), vol.Range(min=1)),
     }
 )
 
 
-SCAN_INTERVAL = timedelta(seconds=60)
-SWITCH_SCAN_INTERVAL = timedelta(seconds=20)
-MIN_INTERVAL = 0.2
+# how often the "natural" effect follows circadian lighting
+NATURAL_INTERVAL = timedelta(seconds=60)
 
 CIRCADIAN_BRIGHTNESS = True
 try:
@@ -67,6 +110,9 @@ except Exception:
 _LOGGER = logging.getLogger(__name__)
 _LOGGER.info(__name__)
 
+# fades of several lights started together run in sync on one clock
+_TRANSITIONS = TransitionCoordinator()
+
 SERVICE_SET_EFFECT = "set_effect"
 SERVICE_SET_ALL_EFFECT = "set_all_effect"
 scenes = ["manual", "natural", "sleep", "warm", "study", "chrismas"]
@@ -101,12 +147,24 @@ async def async_setup_platform(
     # if discovery_info is None:
     #     return
 
+    if pid_cache_store() is None:
+        set_pid_cache_store(
+            Store(hass, PID_LIST_STORAGE_VERSION, PID_CACHE_STORAGE_KEY)
+        )
+
     lights = []
     # treat switch as light in home assistant
     switches = []
     optimistic = config.get("optimistic", False)
+    poll_concurrency = config.get(CONF_POLL_CONCURRENCY, DEFAULT_POLL_CONCURRENCY)
+    poll_timeout = config.get(CONF_POLL_TIMEOUT, DEFAULT_POLL_TIMEOUT)
+    # each device is polled between these bounds, see AdaptivePollSchedule
+    schedule = AdaptivePollSchedule(
+        config.get(CONF_POLL_INTERVAL_MIN, DEFAULT_POLL_INTERVAL_MIN),
+        config.get(CONF_POLL_INTERVAL_MAX, DEFAULT_POLL_INTERVAL_MAX),
+    )
     for item in config.get("lights"):
-        client = tcp_client(item.get("ip"))
+        client = acquire_client(item.get("ip"), item.get("did"))
         client._device_id = item.get("did")
         client._pid = item.get("pid")
         client._dpid = item.get("dpid")
@@ -116,36 +174,90 @@ async def async_setup_platform(
         else:
             switches.append(CozyLifeSwitchAsLight(client, hass, optimistic))
 
-    async_add_devices(lights)
-    for light in lights:
-        await light._tcp_client._connect()
-        await light._tcp_client._device_info()
-        await asyncio.sleep(0.01)
+    async_add_devices(lights + switches)
+
+    @callback
+    def async_stop_transitions(event: Event) -> None:
+        # fades still running would write to sockets being closed
+        _TRANSITIONS.cancel_all()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop_transitions)
+
+    async def async_start(entity):
+        # the client may be shared with, and already connected by, another entity
+        await entity._tcp_client._ensure_connected()
+        await entity._tcp_client._device_info()
+        # becomes available as soon as its device answers
+        if entity.entity_id is not None:
+            entity.async_write_ha_state()
+
+    # Connect in the background so offline devices do not hold up HA startup
+    hass.async_create_background_task(
+        async_poll_all(lights + switches, async_start, poll_concurrency, poll_timeout),
+        f"{DOMAIN} light startup",
+    )
+
+    async def async_refresh(light):
+        state = await light._tcp_client.query()
+        light.async_write_if_changed(light._apply_state(state))
+        return state
+
+    async def async_poll_due(entities):
+        # State changes are pushed by the devices (cmd 10), polling is a safety net
+        # that only visits devices whose adaptive interval has elapsed. Devices
+        # behind an open circuit breaker are left to the heartbeat probe.
+        due = [
+            entity
+            for entity in schedule.due(entities)
+            if entity._tcp_client.breaker.closed
+        ]
+        states = await async_poll_all(
+            due, async_refresh, poll_concurrency, poll_timeout
+        )
+        for entity, state in zip(due, states):
+            schedule.record(entity, state)
 
     async def async_update_lights(now=None):
-        for light in lights:
-            if light._attr_is_on and light._effect == "natural":
-                await light.async_turn_on(effect="natural")
-            else:
-                await light._refresh_state()
-            await asyncio.sleep(0.1)
+        await async_poll_due(
+            [
+                light
+                for light in lights
+                # kept up to date by async_update_natural
+                if not (light._attr_is_on and light._effect == "natural")
+            ]
+        )
 
-    if not optimistic:
-        async_track_time_interval(hass, async_update_lights, SCAN_INTERVAL)
+    async def async_update_natural(now=None):
+        # started together so their fades share one clock
+        await asyncio.gather(
+            *(
+                light.async_turn_on(effect="natural")
+                for light in lights
+                if light._attr_is_on and light._effect == "natural"
+            )
+        )
 
-    async_add_devices(switches)
-    for light in switches:
-        await light._tcp_client._connect()
-        await light._tcp_client._device_info()
-        await asyncio.sleep(0.01)
+    if not optimistic:
+        async_track_time_interval(
+            hass, async_update_lights, timedelta(seconds=schedule.floor)
+        )
+        async_track_time_interval(hass, async_update_natural, NATURAL_INTERVAL)
 
     async def async_update_switches(now=None):
-        for light in switches:
-            await light._refresh_state()
-            await asyncio.sleep(0.1)
+        await async_poll_due(switches)
 
     if not optimistic:
-        async_track_time_interval(hass, async_update_switches, SWITCH_SCAN_INTERVAL)
+        async_track_time_interval(
+            hass, async_update_switches, timedelta(seconds=schedule.floor)
+        )
+        # any pushed state (e.g. the report after our own SET) means activity
+        # removed with the entity, the client may outlive this platform
+        for entity in lights + switches:
+            entity.async_on_remove(
+                entity._tcp_client.add_listener(
+                    lambda state, entity=entity: schedule.poke(entity)
+                )
+            )
 
     platform = entity_platform.async_get_current_platform()
     platform.async_register_entity_service(
@@ -153,16 +265,20 @@ async def async_setup_platform(
     )
 
     async def async_set_all_effect(call: ServiceCall):
-        for light in lights:
-            await light.async_set_effect(call.data.get(ATTR_EFFECT))
-            await asyncio.sleep(0.01)
+        # started together so their fades share one clock
+        await asyncio.gather(
+            *(light.async_set_effect(call.data.get(ATTR_EFFECT)) for light in lights)
+        )
 
     hass.services.async_register(DOMAIN, SERVICE_SET_ALL_EFFECT, async_set_all_effect)
+    async_register_services(hass)
 
 
-class CozyLifeSwitchAsLight(LightEntity):
+class CozyLifeSwitchAsLight(DiffWriteMixin, LightEntity):
     _tcp_client = None
     _attr_is_on = True
+    # refreshed by pushed state frames and the platform safety-net poll
+    _attr_should_poll = False
     _unrecorded_attributes = frozenset({"brightness", "color_temp"})
 
     def __init__(self, tcp_client: tcp_client, hass, optimistic: bool = False) -> None:
@@ -183,11 +299,34 @@ class CozyLifeSwitchAsLight(LightEntity):
         if not self._optimistic:
             await self._refresh_state()
 
-    async def _refresh_state(self):
-        self._state = await self._tcp_client.query()
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        self.async_on_remove(self._tcp_client.add_listener(self._handle_push))
+
+    async def async_will_remove_from_hass(self) -> None:
+        await super().async_will_remove_from_hass()
+        # disconnects the device once no entity of any platform uses it
+        await release_client(self._tcp_client)
+
+    def _handle_push(self, state: dict[str, Any]) -> None:
+        """Apply a state frame pushed by the device."""
+        self.async_write_if_changed(self._apply_state(state))
+
+    async def _refresh_state(self) -> bool:
+        return self._apply_state(await self._tcp_client.query())
+
+    def _apply_state(self, state: dict[str, Any] | None) -> bool:
+        """
+        Apply a device state payload to this entity (no I/O)
+        :return: False if the registers are the ones already applied
+        """
+        if state is None or state == self._state:
+            return False
+        self._state = state
         # _LOGGER.info(f"_name={self._name}, _state={self._state}")
         if self._state:
             self._attr_is_on = self._state.get("1", 0) > 0
+        return True
 
     @property
     def name(self) -> str:
@@ -206,15 +345,20 @@ class CozyLifeSwitchAsLight(LightEntity):
     async def async_turn_on(self, **kwargs: Any) -> None:
         """Turn the entity on."""
         self._attr_is_on = True
-        _LOGGER.info(f"turn_on: {kwargs}")
-        await self._tcp_client.control({"1": 1})
+        # shown optimistically, the next report is applied in full
+        self._state = None
+        self.async_write_ha_state()
+        self._tcp_client.log.debug("turn_on: %s", kwargs)
+        await self._tcp_client.control_coalesced({"1": 1})
         return None
 
     async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn the entity off."""
         self._attr_is_on = False
-        _LOGGER.info("turn_off")
-        await self._tcp_client.control({"1": 0})
+        self._state = None
+        self.async_write_ha_state()
+        self._tcp_client.log.debug("turn_off")
+        await self._tcp_client.control_coalesced({"1": 0})
         return None
 
 
@@ -245,12 +389,14 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
         self._max_brightness = 255
         self._min_brightness = 1
         self._name = tcp_client.device_id[-4:]
-        self._min_mireds = colorutil.color_temperature_kelvin_to_mired(6500)
-        self._max_mireds = colorutil.color_temperature_kelvin_to_mired(2700)
-        self._miredsratio = (self._max_mireds - self._min_mireds) / 1000
+        self._min_mireds = MIN_MIREDS
+        self._max_mireds = MAX_MIREDS
         self._attr_color_temp = int(self._min_mireds)
         self._attr_hs_color = (0, 0)
-        self._transitioning = 0
+        # intermediate frames are pipelined, only the last one is acknowledged
+        self._transition = TransitionEngine(
+            tcp_client.control_nowait, tcp_client.control
+        )
         self._attr_is_on = False
         self._attr_brightness = 0
         self._optimistic = optimistic
@@ -290,15 +436,17 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
             self._attr_color_mode = ColorMode.ONOFF
 
         _LOGGER.info(
-            f"{self._unique_id}: supported_color_modes="
-            f"{self._attr_supported_color_modes}, color_mode="
-            f"{self._attr_color_mode}, dpid={dpid}"
+            "%s: supported_color_modes=%s, color_mode=%s, dpid=%s",
+            self._unique_id,
+            self._attr_supported_color_modes,
+            self._attr_color_mode,
+            dpid,
         )
         self.SUPPORT_COZYLIGHT = self.get_supported_features()
 
     async def async_set_effect(self, effect: str):
         """Set the effect regardless it is On or Off."""
-        _LOGGER.info(f"onoff:{self._attr_is_on} effect:{effect}")
+        self._tcp_client.log.debug("onoff:%s effect:%s", self._attr_is_on, effect)
         self._effect = effect
         if self._attr_is_on:
             await self.async_turn_on(effect=effect)
@@ -313,16 +461,34 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
         """Return the list of supported effects."""
         return self._scenes
 
-    async def _refresh_state(self):
-        # Query device & set attributes
-        self._state = await self._tcp_client.query()
+    def _handle_push(self, state: dict[str, Any]) -> None:
+        """Apply a state frame pushed by the device."""
+        if self._transition.running:
+            # intermediate frames of our own fade, the target is already shown
+            return
+        super()._handle_push(state)
+
+    async def _async_reconcile(self) -> None:
+        """Read back the device state once a fade is over."""
+        if not self._optimistic:
+            self.async_write_if_changed(await self._refresh_state())
+
+    def _apply_state(self, state: dict[str, Any] | None) -> bool:
+        """
+        Apply a device state payload to this entity (no I/O)
+        :return: False if the registers are the ones already applied, in
+            which case no conversion is done either
+        """
+        if state is None or state == self._state:
+            return False
+        self._state = state
         # _LOGGER.info(f'_name={self._name},_state={self._state}')
         if self._state:
             self._attr_is_on = self._state.get("1", 0) > 0
 
             # Always update brightness if available
             if "4" in self._state:
-                self._attr_brightness = int(self._state["4"] / 1000 * 255)
+                self._attr_brightness = brightness_from_device(self._state["4"])
 
             mode = self._state.get("2", 0)
             if mode == 0:  # White mode
@@ -330,12 +496,10 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
                     "3" in self._state
                     and ColorMode.COLOR_TEMP in self._attr_supported_color_modes
                 ):
-                    color_temp = self._state["3"]
-                    if color_temp < 60000:
+                    color_temp = mireds_from_device(self._state["3"])
+                    if color_temp is not None:
                         self._attr_color_mode = ColorMode.COLOR_TEMP
-                        self._attr_color_temp = round(
-                            self._max_mireds - color_temp * self._miredsratio
-                        )
+                        self._attr_color_temp = color_temp
             elif mode == 1:  # RGB or Effect mode
                 if (
                     "5" in self._state
@@ -343,14 +507,13 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
                     and ColorMode.HS in self._attr_supported_color_modes
                 ):
                     color = self._state["5"]
-                    if color < 60000:
+                    if color < DEVICE_UNSET:
                         self._attr_color_mode = ColorMode.HS
-                        r, g, b = colorutil.color_hs_to_RGB(
-                            round(self._state["5"]), round(self._state["6"] / 10)
-                        )
                         # May need to adjust
-                        hs_color = colorutil.color_RGB_to_hs(r, g, b)
-                        self._attr_hs_color = hs_color
+                        self._attr_hs_color = hs_from_device(
+                            self._state["5"], self._state["6"]
+                        )
+        return True
 
     # autobrightness from circadian_lighting if enabled
     def calc_color_temp(self):
@@ -359,7 +522,7 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
             if self._cl is None:
                 return None
         colortemp_in_kelvin = self._cl._colortemp
-        autocolortemp = colorutil.color_temperature_kelvin_to_mired(colortemp_in_kelvin)
+        autocolortemp = kelvin_to_mireds(colortemp_in_kelvin)
         return autocolortemp
 
     def calc_brightness(self):
@@ -408,7 +571,7 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
         colortemp_kelvin = kwargs.get(ATTR_COLOR_TEMP_KELVIN)
         colortemp = None
         if colortemp_kelvin is not None:
-            colortemp = colorutil.color_temperature_kelvin_to_mired(colortemp_kelvin)
+            colortemp = kelvin_to_mireds(colortemp_kelvin)
         # tuple
         hs_color = kwargs.get(ATTR_HS_COLOR)
         transition = kwargs.get(ATTR_TRANSITION)
@@ -425,13 +588,18 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
         #     originalcolortemp = self._attr_color_temp
         # else:
         #     originalhs = self._attr_hs_color
-        _LOGGER.info(
-            f"turn_on.kwargs={kwargs}, colortemp={colortemp}, "
-            f"hs_color={hs_color}, "
-            f"originalbrightness={originalbrightness}, "
-            f"self._attr_is_on={self._attr_is_on}"
+        self._tcp_client.log.debug(
+            "turn_on.kwargs=%s, colortemp=%s, hs_color=%s, "
+            "originalbrightness=%s, self._attr_is_on=%s",
+            kwargs,
+            colortemp,
+            hs_color,
+            originalbrightness,
+            self._attr_is_on,
         )
         self._attr_is_on = True
+        # shown optimistically, the next report is applied in full
+        self._state = None
         self.async_write_ha_state()
         payload = {"1": 255, "2": 0}
         count = 0
@@ -439,7 +607,7 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
             # Color: mininum light brightness 12, max 1000
             # White mininum light brightness 4, max 1000
             self._effect = "manual"
-            payload["4"] = round(brightness / 255 * 1000)
+            payload["4"] = brightness_to_device(brightness)
             self._attr_brightness = brightness
             count += 1
 
@@ -452,9 +620,7 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
             self._effect = "manual"
             self._attr_color_mode = ColorMode.COLOR_TEMP
             self._attr_color_temp = colortemp
-            payload["3"] = 1000 - round(
-                (colortemp - self._min_mireds) / self._miredsratio
-            )
+            payload["3"] = mireds_to_device(colortemp)
             count += 1
 
         if hs_color is not None and ColorMode.HS in self._attr_supported_color_modes:
@@ -463,11 +629,8 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
             self._effect = "manual"
             self._attr_color_mode = ColorMode.HS
             self._attr_hs_color = hs_color
-            r, g, b = colorutil.color_hs_to_RGB(*hs_color)
             # color is not balanced right. needs additional tuning
-            hs_color = colorutil.color_RGB_to_hs(r, g, b)
-            payload["5"] = round(hs_color[0])
-            payload["6"] = round(hs_color[1] * 10)
+            payload["5"], payload["6"] = hs_to_device(*hs_color)
             count += 1
 
         if count == 0:
@@ -478,16 +641,16 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
                 payload["2"] = 0  # White mode for natural
                 if CIRCADIAN_BRIGHTNESS:
                     brightness = self.calc_brightness()
-                    payload["4"] = round(brightness / 255 * 1000)
+                    payload["4"] = brightness_to_device(brightness)
                     self._attr_brightness = brightness
                     if ColorMode.COLOR_TEMP in self._attr_supported_color_modes:
                         self._attr_color_mode = ColorMode.COLOR_TEMP
                         colortemp = self.calc_color_temp()
-                        payload["3"] = 1000 - round(
-                            (colortemp - self._min_mireds) / self._miredsratio
+                        payload["3"] = mireds_to_device(colortemp)
+                        self._tcp_client.log.debug(
+                            "color=%s,payload3=%s", colortemp, payload["3"]
                         )
-                        _LOGGER.info(f'color={colortemp},payload3={payload["3"]}')
-                    if self._transitioning != 0:
+                    if self._transition.running:
                         return None
                     if transition is None:
                         transition = 5
@@ -529,132 +692,74 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
         else:
             payload["2"] = 0  # White mode
 
-        self._transitioning = 0
+        # not polled by HA, publish the target attributes ourselves
+        self.async_write_ha_state()
 
-        if transition:
-            self._transitioning = time.time()
-            now = self._transitioning
-            if self._effect == "chrismas":
-                await self._tcp_client.control(payload)
-                self._transitioning = 0
-                return None
-            if brightness:
-                payloadtemp = {"1": 255, "2": 0}
-                p4i = round(originalbrightness / 255 * 1000)
-                p4f = payload["4"]
-                p4steps = abs(round((p4i - p4f) / 4))
-                _LOGGER.info(f"p4i={p4i},p4f={p4f},p4steps={p4steps}")
-            else:
-                p4steps = 0
-            if self._attr_color_mode == ColorMode.COLOR_TEMP:
-                p3i = 1000 - round(
-                    (originalcolortemp - self._min_mireds) / self._miredsratio
-                )
-                p3steps = 0
-                if "3" in payload:
-                    p3f = payload["3"]
-                    p3steps = abs(round((p3i - p3f) / 4))
-                _LOGGER.info(f"p3i={p3i}, " f"p3f={p3f}, " f"p3steps={p3steps}")
-                steps = p3steps if p3steps > p4steps else p4steps
-                if steps <= 0:
-                    self._transitioning = 0
-                    return None
-                stepseconds = transition / steps
-                if stepseconds < MIN_INTERVAL:
-                    stepseconds = MIN_INTERVAL
-                    steps = round(transition / stepseconds)
-                    stepseconds = transition / steps
-                _LOGGER.info(
-                    f"steps={steps}, transition={transition}, "
-                    f"stepseconds={stepseconds}, p3steps={p3steps}, "
-                    f"p4steps={p4steps}"
+        if transition and self._effect != "chrismas":
+            start = {}
+            end = {}
+            if "4" in payload:
+                start["4"] = brightness_to_device(originalbrightness)
+                end["4"] = payload["4"]
+            if self._attr_color_mode == ColorMode.COLOR_TEMP and "3" in payload:
+                start["3"] = mireds_to_device(originalcolortemp)
+                end["3"] = payload["3"]
+            elif self._attr_color_mode == ColorMode.HS and "5" in payload:
+                start["5"] = round(originalhs[0])
+                start["6"] = round(originalhs[1] * 10)
+                end["5"] = payload["5"]
+                end["6"] = payload["6"]
+            self._tcp_client.log.debug(
+                "start=%s, end=%s, transition=%s", start, end, transition
+            )
+            if start != end:
+                # runs in the background, the service call returns right away
+                _TRANSITIONS.start(
+                    self._transition,
+                    # frames stay in the target mode, the last one is the full payload
+                    {"1": 255, "2": payload["2"]},
+                    start,
+                    end,
+                    transition,
+                    final=payload,
+                    on_done=self._async_reconcile,
+                    # brightness steps look even to the eye, not to the meter
+                    gamma_dpids=("4",),
                 )
-                for s in range(1, steps + 1):
-                    brightness_value = p4i + (p4f - p4i) * s / steps
-                    payloadtemp["4"] = round(brightness_value)
-                    if p3steps != 0:
-                        payloadtemp["3"] = round(p3i + (p3f - p3i) * s / steps)
-                    if now == self._transitioning:
-                        await self._tcp_client.control(payloadtemp)
-                        _LOGGER.info(
-                            f"payloadtemp={payloadtemp}, " f"stepseconds={stepseconds}"
-                        )
-                        if s < steps:
-                            await asyncio.sleep(stepseconds)
-                    else:
-                        self._transitioning = 0
-                        return None
+                return None
 
-            elif self._attr_color_mode == ColorMode.HS:
-                p5i = originalhs[0]
-                p6i = originalhs[1] * 10
-                p5steps = 0
-                p6steps = 0
-                if "5" in payload:
-                    p5f = payload["5"]
-                    p6f = payload["6"]
-                    p5steps = abs(round((p5i - p5f) / 3))
-                    p6steps = abs(round((p6i - p6f) / 10))
-                steps = max([p4steps, p5steps, p6steps])
-                if steps <= 0:
-                    self._transitioning = 0
-                    return None
-                stepseconds = transition / steps
-                if stepseconds < 4:
-                    steps = round(transition / stepseconds)
-                    stepseconds = transition / steps
-                _LOGGER.info(f"steps={steps}")
-                for s in range(steps):
-                    payloadtemp["4"] = round(p4i + (p4f - p4i) * s / steps)
-                    if p5steps != 0:
-                        payloadtemp["5"] = round(p5i + (p5f - p5i) * s / steps)
-                        payloadtemp["6"] = round(p6i + (p6f - p6i) * s / steps)
-                    if now == self._transitioning:
-                        await self._tcp_client.control(payloadtemp)
-                        await asyncio.sleep(stepseconds)
-                    else:
-                        self._transitioning = 0
-                        return None
-        else:
-            await self._tcp_client.control(payload)
-        # self._refresh_state()
-        self._transitioning = 0
+        self._transition.cancel()
+        await self._tcp_client.control_coalesced(payload)
         return None
 
     async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn the entity off."""
-        self._transitioning = 0
+        self._transition.cancel()
         self._attr_is_on = False
+        self._state = None
         self.async_write_ha_state()
         transition = kwargs.get(ATTR_TRANSITION)
         originalbrightness = self._attr_brightness
         if self._effect == "natural" and transition is None:
             transition = 5
-        if transition:
-            self._transitioning = time.time()
-            now = self._transitioning
-            payloadtemp = {"1": 255, "2": 0}
-            p4i = round(originalbrightness / 255 * 1000)
-            p4f = 0
-            steps = abs(round((p4i - p4f) / 4))
-            stepseconds = transition / steps
-            if stepseconds < MIN_INTERVAL:
-                stepseconds = MIN_INTERVAL
-                steps = round(transition / stepseconds)
-                stepseconds = transition / steps
-            for s in range(1 + steps + 1):
-                payloadtemp["4"] = round(p4i + (p4f - p4i) * s / steps)
-                if now == self._transitioning:
-                    await self._tcp_client.control(payloadtemp)
-                    if s < steps:
-                        await asyncio.sleep(stepseconds)
-                    else:
-                        await super().async_turn_off()
-                else:
-                    return None
-        else:
-            await super().async_turn_off()
-        self._transitioning = 0
+        if transition and originalbrightness:
+            # dim in the mode the light is in, same rule as async_turn_on
+            if self._effect != "manual" or self._attr_color_mode == ColorMode.HS:
+                mode = 1
+            else:
+                mode = 0
+            _TRANSITIONS.start(
+                self._transition,
+                {"1": 255, "2": mode},
+                {"4": brightness_to_device(originalbrightness)},
+                {"4": 0},
+                transition,
+                final={"1": 0},
+                on_done=self._async_reconcile,
+                gamma_dpids=("4",),
+            )
+            return None
+        await super().async_turn_off()
         return None
 
     @property
@@ -691,6 +796,10 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
     def assumed_state(self):
         return True
 
+    async def async_will_remove_from_hass(self) -> None:
+        self._transition.cancel()
+        await super().async_will_remove_from_hass()
+
     async def async_added_to_hass(self):
         await super().async_added_to_hass()
         last_state = await self.async_get_last_state()
@@ -703,7 +812,7 @@ class CozyLifeLight(CozyLifeSwitchAsLight, RestoreEntity):
     def extra_state_attributes(self):
         attributes = {}
         attributes["last_effect"] = self._effect
-        attributes["transitioning"] = self._transitioning
+        attributes["transitioning"] = self._transition.started_at
 
         return attributes
 
@@ -0,0 +1,144 @@
+"""Per-device protocol counters and latency histograms."""
+
+import bisect
+from collections import defaultdict
+from typing import Iterable
+
+try:
+    from .state import WRITE_STATS
+except ImportError:
+    from state import WRITE_STATS
+
+# upper bounds of the latency buckets (milliseconds), the last one is open
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+CMD_NAMES = {0: "info", 2: "query", 3: "set", 10: "report"}
+
+
+class LatencyHistogram:
+    """Fixed bucket histogram, cheap enough to update on every request."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS_MS) -> None:
+        self.bounds = tuple(buckets)
+        # one more for values above the last bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        :param q: 0..1
+        :return: upper bound of the bucket holding the q-quantile, max for the open bucket
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return float(bound)
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 1) if self.count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "max_ms": round(self.max, 1),
+            "buckets": {
+                **{
+                    f"le_{bound}": count
+                    for bound, count in zip(self.bounds, self.counts)
+                },
+                "inf": self.counts[-1],
+            },
+        }
+
+
+class ClientMetrics:
+    """Counters of one tcp_client, updated in place by the client."""
+
+    def __init__(self) -> None:
+        # cmd -> requests sent expecting a reply
+        self.requests: dict = defaultdict(int)
+        # cmd -> requests that got no reply in time
+        self.timeouts: dict = defaultdict(int)
+        # cmd -> round trip of answered requests (ms)
+        self.latency: dict = defaultdict(LatencyHistogram)
+        # replies whose sn matched no pending request, e.g. after a timeout
+        self.sn_mismatches = 0
+        # lines the frame decoder could not use
+        self.discarded_lines = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.heartbeat_failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def observe_request(self, cmd: int, latency_ms: float) -> None:
+        self.latency[cmd].observe(latency_ms)
+
+    def as_dict(self) -> dict:
+        def by_cmd(values: dict) -> dict:
+            return {
+                CMD_NAMES.get(cmd, str(cmd)): value for cmd, value in values.items()
+            }
+
+        return {
+            "requests": by_cmd(self.requests),
+            "timeouts": by_cmd(self.timeouts),
+            "latency": by_cmd(
+                {cmd: histogram.as_dict() for cmd, histogram in self.latency.items()}
+            ),
+            "sn_mismatches": self.sn_mismatches,
+            "discarded_lines": self.discarded_lines,
+            "connects": self.connects,
+            # every connect after the first one
+            "reconnects": max(0, self.connects - 1),
+            "connect_failures": self.connect_failures,
+            "heartbeat_failures": self.heartbeat_failures,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+def build_diagnostics(clients: Iterable) -> dict:
+    """
+    Diagnostics dump of many devices, slowest first
+    :param clients: tcp_client instances
+    :return: dict, JSON serializable
+    """
+    devices = []
+    for client in clients:
+        devices.append(
+            {
+                "ip": client._ip,
+                "did": client.device_id,
+                "available": client.available,
+                "breaker": client.breaker.state,
+                "pending_requests": len(client._pending),
+                **client.metrics.as_dict(),
+            }
+        )
+
+    def slowness(device: dict) -> float:
+        return max(
+            (latency["p95_ms"] for latency in device["latency"].values()), default=0.0
+        )
+
+    devices.sort(key=slowness, reverse=True)
+    return {
+        "devices": devices,
+        # Home Assistant state writes of all entities, see DiffWriteMixin
+        "state_writes": dict(WRITE_STATS),
+    }
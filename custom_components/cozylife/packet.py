@@ -0,0 +1,153 @@
+"""Wire format of the device protocol: one JSON object per CRLF terminated line."""
+
+import json
+import logging
+from typing import Callable
+
+try:
+    import orjson
+
+    _json_loads: Callable = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+_LOGGER = logging.getLogger(__name__)
+
+CMD_INFO = 0
+CMD_QUERY = 2
+CMD_SET = 3
+# state report the device sends on its own, e.g. after every SET
+CMD_REPORT = 10
+CMD_LIST = [CMD_INFO, CMD_QUERY, CMD_SET]
+
+# INFO and QUERY only differ by sn: the bytes around it are built once
+_TEMPLATES = {
+    CMD_INFO: (b'{"pv":0,"cmd":0,"sn":"', b'","msg":{}}\r\n'),
+    CMD_QUERY: (b'{"pv":0,"cmd":2,"sn":"', b'","msg":{"attr":[0]}}\r\n'),
+}
+_SET_PREFIX = b'{"pv":0,"cmd":3,"sn":"'
+
+# bytes asked from the socket per read
+READ_CHUNK = 4096
+# longest line accepted from a device, the biggest real frames are ~300 bytes
+MAX_FRAME_SIZE = 16384
+
+
+def _encode_json(message: dict) -> bytes:
+    return bytes(json.dumps(message, separators=(",", ":")) + "\r\n", encoding="utf8")
+
+
+def encode_packet(cmd: int, sn: str, payload: dict) -> bytes:
+    """
+    package message
+    :param cmd: CMD_INFO, CMD_QUERY or CMD_SET
+    :param sn: message sn, digits only
+    :param payload: dpid -> value, only used by CMD_SET
+    :return: the CRLF terminated line, byte for byte what json.dumps would give
+    """
+    template = _TEMPLATES.get(cmd)
+    if template is not None:
+        return b"".join((template[0], sn.encode(), template[1]))
+
+    if CMD_SET != cmd:
+        raise Exception("CMD is not valid")
+
+    # fast path: numeric str dpids with plain int values, the common light/switch
+    # SET; anything else (e.g. int dpids) goes through json.dumps
+    if all(
+        type(key) is str and key.isascii() and key.isdigit() and type(value) is int
+        for key, value in payload.items()
+    ):
+        attr = ",".join(str(int(key)) for key in payload)
+        data = ",".join(f'"{key}":{value}' for key, value in payload.items())
+        return b"".join(
+            (
+                _SET_PREFIX,
+                sn.encode(),
+                f'","msg":{{"attr":[{attr}],"data":{{{data}}}}}}}\r\n'.encode(),
+            )
+        )
+
+    return _encode_json(
+        {
+            "pv": 0,
+            "cmd": cmd,
+            "sn": sn,
+            "msg": {
+                "attr": [int(item) for item in payload.keys()],
+                "data": payload,
+            },
+        }
+    )
+
+
+class FrameDecoder:
+    """
+    Incremental decoder of the device byte stream.
+
+    Data is fed as it arrives, in whatever pieces TCP delivers; complete
+    lines are parsed and returned, a partial line waits for the rest. Lines
+    longer than max_frame_size are dropped up to their line end, so a
+    misbehaving device cannot grow the buffer without bound.
+    """
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE, loads=None) -> None:
+        self.max_frame_size = max_frame_size
+        self._loads = loads or _json_loads
+        self._buffer = bytearray()
+        # skipping the rest of an oversized line
+        self._discarding = False
+        # lines that were not a JSON object or were too long
+        self.dropped = 0
+
+    def feed(self, data: bytes) -> list:
+        """
+        :param data: bytes read from the socket
+        :return: the JSON objects of all lines completed by data
+        """
+        frames = []
+        buffer = self._buffer
+        # only the new bytes can hold a line end
+        scan_from = len(buffer)
+        buffer += data
+        start = 0
+        while True:
+            end = buffer.find(b"\n", scan_from)
+            if end < 0:
+                break
+            if self._discarding:
+                self._discarding = False
+            else:
+                frame = self._decode(buffer[start:end])
+                if frame is not None:
+                    frames.append(frame)
+            start = scan_from = end + 1
+        del buffer[:start]
+
+        if len(buffer) > self.max_frame_size:
+            if not self._discarding:
+                self.dropped += 1
+                _LOGGER.debug(
+                    "dropping frame longer than %d bytes", self.max_frame_size
+                )
+            self._discarding = True
+            buffer.clear()
+        return frames
+
+    def _decode(self, line: bytes):
+        line = line.strip()
+        if not line:
+            return None
+        if len(line) > self.max_frame_size:
+            self.dropped += 1
+            return None
+        try:
+            frame = self._loads(line)
+        except ValueError:
+            self.dropped += 1
+            _LOGGER.debug("dropping unparsable line %r", bytes(line))
+            return None
+        if not isinstance(frame, dict):
+            self.dropped += 1
+            return None
+        return frame
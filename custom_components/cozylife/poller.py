@@ -0,0 +1,117 @@
+"""Concurrent polling of many devices."""
+
+import asyncio
+import copy
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, Optional, TypeVar
+
+_LOGGER = logging.getLogger(__name__)
+
+# how many devices are queried at the same time
+DEFAULT_POLL_CONCURRENCY = 8
+# deadline for a single device poll (seconds)
+DEFAULT_POLL_TIMEOUT = 5.0
+# bounds of the adaptive per-device poll interval (seconds)
+DEFAULT_POLL_INTERVAL_MIN = 10.0
+DEFAULT_POLL_INTERVAL_MAX = 300.0
+
+T = TypeVar("T")
+
+
+async def async_poll_all(
+    items: Iterable[T],
+    poll: Callable[[T], Awaitable[Any]],
+    concurrency: int = DEFAULT_POLL_CONCURRENCY,
+    timeout: float = DEFAULT_POLL_TIMEOUT,
+) -> list:
+    """
+    Run poll(item) for every item, at most concurrency at once.
+    Each poll has its own deadline, so a slow or failing device only affects itself.
+    :param items:
+    :param poll: coroutine function polling one item
+    :param concurrency: max polls in flight
+    :param timeout: per-item deadline in seconds
+    :return: results in item order, None for polls that failed or timed out
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def poll_one(item: T) -> Any:
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(poll(item), timeout=timeout)
+            except asyncio.TimeoutError:
+                _LOGGER.info("Polling %s timed out after %ss", item, timeout)
+            except Exception:
+                _LOGGER.exception("Polling %s failed", item)
+            return None
+
+    return await asyncio.gather(*(poll_one(item) for item in items))
+
+
+class AdaptivePollSchedule:
+    """
+    Per-device poll intervals.
+    A device is polled at the floor interval right after activity (a pushed
+    state frame or a changed poll result). Its interval doubles, up to the
+    ceiling, for every poll that finds the same state or no answer at all.
+    """
+
+    def __init__(
+        self,
+        floor: float = DEFAULT_POLL_INTERVAL_MIN,
+        ceiling: float = DEFAULT_POLL_INTERVAL_MAX,
+    ) -> None:
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        # key -> current interval (seconds)
+        self._interval: dict = {}
+        # key -> time.monotonic() the next poll is due
+        self._due_at: dict = {}
+        # key -> state seen by the last poll
+        self._last_state: dict = {}
+
+    def interval(self, key) -> float:
+        return self._interval.get(key, self.floor)
+
+    def due(self, keys: Iterable[T], now: Optional[float] = None) -> list:
+        """
+        :param keys:
+        :param now: time.monotonic()
+        :return: keys whose next poll is due, unknown keys are due at once
+        """
+        now = time.monotonic() if now is None else now
+        return [key for key in keys if self._due_at.get(key, 0) <= now]
+
+    def record(self, key, state: Any, now: Optional[float] = None) -> None:
+        """
+        Schedule the next poll from a poll result
+        :param key:
+        :param state: poll result, None if the device did not answer
+        :param now: time.monotonic()
+        """
+        now = time.monotonic() if now is None else now
+        changed = state is not None and (
+            key not in self._last_state or self._last_state[key] != state
+        )
+        if changed:
+            interval = self.floor
+        else:
+            # same state or offline: back off
+            interval = min(self.interval(key) * 2, self.ceiling)
+        if state is not None:
+            self._last_state[key] = copy.copy(state)
+        else:
+            self._last_state.pop(key, None)
+        self._interval[key] = interval
+        self._due_at[key] = now + interval
+
+    def poke(self, key, now: Optional[float] = None) -> None:
+        """
+        Device showed activity (command, pushed state): poll it at the floor again
+        :param key:
+        :param now: time.monotonic()
+        """
+        now = time.monotonic() if now is None else now
+        self._interval[key] = self.floor
+        self._due_at[key] = min(self._due_at.get(key, now), now + self.floor)
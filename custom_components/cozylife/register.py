@@ -0,0 +1,114 @@
+"""Batched writes to the bit register shared by the rockers of a multi-gang switch."""
+
+import asyncio
+import logging
+from typing import Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# rocker toggles of one device within this many seconds go out as one SET
+DEFAULT_BATCH_WINDOW = 0.05
+# a register value seen this recently (push, poll or our own write) is written
+# over without reading it back first (seconds)
+DEFAULT_MAX_AGE = 2.0
+
+
+class BitRegister:
+    """
+    Register '1' of a multi-gang switch, one bit per rocker.
+
+    set/clear requests of all rockers are collected for window seconds and
+    applied as a single read-modify-write. The read is skipped when the
+    client's state store has a fresh value, so a scene toggling every rocker
+    of a device costs one round trip.
+    """
+
+    def __init__(
+        self,
+        client,
+        dpid: str = "1",
+        lock: Optional[asyncio.Lock] = None,
+        window: float = DEFAULT_BATCH_WINDOW,
+        max_age: float = DEFAULT_MAX_AGE,
+    ) -> None:
+        self._client = client
+        self.dpid = dpid
+        # serializes the read-modify-write with other users of the device
+        self._lock = lock or asyncio.Lock()
+        self.window = window
+        self.max_age = max_age
+        # bits of the batch being collected
+        self._set_bits = 0
+        self._clear_bits = 0
+        self._batch: Optional[asyncio.Future] = None
+        # flush tasks, kept so they are not garbage collected
+        self._flush_tasks: set = set()
+
+    @property
+    def value(self) -> Optional[int]:
+        return self._client.state.get(self.dpid)
+
+    async def write(self, set_bits: int = 0, clear_bits: int = 0) -> Optional[int]:
+        """
+        Set and clear bits, together with the other requests of the window
+        :param set_bits: mask of bits to turn on
+        :param clear_bits: mask of bits to turn off
+        :return: the register value written, None if the current value could not
+            be read or the device did not ack
+        """
+        # the later request wins for a bit both set and cleared
+        self._set_bits = (self._set_bits | set_bits) & ~clear_bits
+        self._clear_bits = (self._clear_bits | clear_bits) & ~set_bits
+        if self._batch is None:
+            self._batch = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(self._flush(self._batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        return await asyncio.shield(self._batch)
+
+    def cancel(self) -> None:
+        """Drop the batches not written yet, their writers get None."""
+        for task in self._flush_tasks:
+            task.cancel()
+        batch, self._batch = self._batch, None
+        self._set_bits = self._clear_bits = 0
+        if batch is not None and not batch.done():
+            batch.set_result(None)
+
+    async def _flush(self, batch: asyncio.Future) -> None:
+        try:
+            await asyncio.sleep(self.window)
+            async with self._lock:
+                # requests arriving from here on form the next batch
+                set_bits, clear_bits = self._set_bits, self._clear_bits
+                self._set_bits = self._clear_bits = 0
+                self._batch = None
+
+                current = self._client.state.get(self.dpid, self.max_age)
+                if current is None:
+                    state = await self._client.query()
+                    current = (state or {}).get(self.dpid)
+                if current is None:
+                    # writing over an unknown value would switch the other
+                    # rockers off
+                    _LOGGER.info(
+                        "register %s: current value unknown, not written", self.dpid
+                    )
+                    batch.set_result(None)
+                    return
+                value = (current | set_bits) & ~clear_bits
+                _LOGGER.debug(
+                    "register %s: 0x%02X -> 0x%02X", self.dpid, current, value
+                )
+                if await self._client.control({self.dpid: value}):
+                    batch.set_result(value)
+                else:
+                    batch.set_result(None)
+        except asyncio.CancelledError:
+            if not batch.done():
+                batch.set_result(None)
+            raise
+        except Exception as e:
+            if self._batch is batch:
+                self._batch = None
+            batch.set_exception(e)
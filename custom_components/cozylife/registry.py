@@ -0,0 +1,94 @@
+"""Process wide registry handing out one shared tcp_client per device."""
+
+import logging
+from typing import Optional
+
+try:
+    from .tcp_client import tcp_client
+except ImportError:
+    from tcp_client import tcp_client
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """
+    One tcp_client per physical device, shared by all entities and platforms.
+
+    The firmware only accepts a few TCP sessions, so a device configured in
+    both the light and the switch platform, or set up again on reload, must
+    reuse the open connection. Clients are found by ip or did and reference
+    counted; the last release disconnects the client.
+    """
+
+    def __init__(self) -> None:
+        # ip or did -> client
+        self._by_key: dict = {}
+        # client -> number of holders
+        self._refs: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    def clients(self) -> list:
+        return list(self._refs)
+
+    def acquire(self, ip: str, did: Optional[str] = None) -> tcp_client:
+        """
+        Shared client of a device, created on first use
+        :param ip:
+        :param did: device id, finds the client even if the ip is configured differently
+        :return: tcp_client, to be handed back with release()
+        """
+        client = self._by_key.get(ip)
+        if client is None and did:
+            client = self._by_key.get(did)
+        if client is None:
+            client = tcp_client(ip)
+            self._refs[client] = 0
+        elif client._ip != ip:
+            _LOGGER.warning(
+                "Device %s is configured as %s and %s, keeping the first",
+                did,
+                client._ip,
+                ip,
+            )
+        self._refs[client] += 1
+        self._by_key[client._ip] = client
+        if did:
+            self._by_key[did] = client
+        return client
+
+    async def release(self, client: tcp_client) -> None:
+        """
+        Hand a client back, disconnecting it when nobody holds it any more
+        :param client:
+        """
+        refs = self._refs.get(client)
+        if refs is None:
+            return
+        if refs > 1:
+            self._refs[client] = refs - 1
+            return
+        del self._refs[client]
+        for key in [key for key, value in self._by_key.items() if value is client]:
+            del self._by_key[key]
+        await client.disconnect()
+
+
+_REGISTRY = ClientRegistry()
+
+
+def acquire_client(ip: str, did: Optional[str] = None) -> tcp_client:
+    """See ClientRegistry.acquire"""
+    return _REGISTRY.acquire(ip, did)
+
+
+async def release_client(client: tcp_client) -> None:
+    """See ClientRegistry.release"""
+    await _REGISTRY.release(client)
+
+
+def registered_clients() -> list:
+    """Every client in use by an entity"""
+    return _REGISTRY.clients()
@@ -0,0 +1,62 @@
+"""Integration wide services, registered by whichever platform sets up first."""
+
+from __future__ import annotations
+
+import homeassistant.helpers.config_validation as cv
+import voluptuous as vol
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
+
+from .const import DOMAIN
+from .devlog import DEFAULT_FRAME_SAMPLE, set_device_debug
+from .metrics import build_diagnostics
+from .registry import registered_clients
+
+SERVICE_GET_METRICS = "get_metrics"
+SERVICE_SET_DEBUG = "set_debug"
+
+ATTR_DEVICE = "device"
+ATTR_ENABLED = "enabled"
+ATTR_FRAME_SAMPLE = "frame_sample"
+
+SERVICE_SCHEMA_SET_DEBUG = vol.Schema(
+    {
+        vol.Required(ATTR_DEVICE): cv.string,
+        vol.Optional(ATTR_ENABLED, default=True): cv.boolean,
+        vol.Optional(ATTR_FRAME_SAMPLE, default=DEFAULT_FRAME_SAMPLE): vol.All(
+            vol.Coerce(int), vol.Range(min=1)
+        ),
+    }
+)
+
+
+def async_register_services(hass: HomeAssistant) -> None:
+    """Register the services not bound to one platform, once."""
+    if hass.services.has_service(DOMAIN, SERVICE_GET_METRICS):
+        return
+
+    async def async_get_metrics(call: ServiceCall) -> ServiceResponse:
+        # protocol counters of every device, for spotting slow or flaky ones
+        return build_diagnostics(registered_clients())
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_METRICS,
+        async_get_metrics,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def async_set_debug(call: ServiceCall) -> None:
+        set_device_debug(
+            call.data[ATTR_DEVICE],
+            call.data[ATTR_ENABLED],
+            call.data[ATTR_FRAME_SAMPLE],
+        )
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_DEBUG, async_set_debug, schema=SERVICE_SCHEMA_SET_DEBUG
+    )
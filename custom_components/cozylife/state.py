@@ -0,0 +1,129 @@
+"""Last known state of a device, shared by everything using its client."""
+
+import time
+from typing import Optional
+
+# where a value came from
+SOURCE_POLL = "poll"
+SOURCE_PUSH = "push"
+# a SET the device acked, the value is what we wrote
+SOURCE_WRITE = "write"
+
+# entities of one device refreshing within this many seconds share one query
+SHARED_QUERY_MAX_AGE = 1.0
+
+
+class DeviceStateStore:
+    """
+    dpid values of one device with the time and source of each.
+
+    Every query, pushed report and acked SET of the client lands here, so
+    callers that only need a recent value can read it instead of asking the
+    device again.
+    """
+
+    def __init__(self) -> None:
+        self._values: dict = {}
+        # dpid -> (time.monotonic() captured, source)
+        self._captured: dict = {}
+
+    def __contains__(self, dpid: str) -> bool:
+        return dpid in self._values
+
+    def update(self, data: Optional[dict], source: str, now: Optional[float] = None):
+        """
+        Record values
+        :param data: dpid -> value, None is ignored
+        :param source: SOURCE_POLL, SOURCE_PUSH or SOURCE_WRITE
+        :param now: time.monotonic()
+        """
+        if not data:
+            return
+        now = time.monotonic() if now is None else now
+        for dpid, value in data.items():
+            self._values[dpid] = value
+            self._captured[dpid] = (now, source)
+
+    def age(self, dpid: Optional[str] = None, now: Optional[float] = None) -> float:
+        """
+        :param dpid: one dpid, all of them (the oldest) if None
+        :param now: time.monotonic()
+        :return: seconds since capture, inf if never captured
+        """
+        if dpid is None:
+            captured = [at for at, _ in self._captured.values()]
+        else:
+            captured = [self._captured[dpid][0]] if dpid in self._captured else []
+        if not captured:
+            return float("inf")
+        now = time.monotonic() if now is None else now
+        return now - min(captured)
+
+    def source(self, dpid: str) -> Optional[str]:
+        captured = self._captured.get(dpid)
+        return captured[1] if captured else None
+
+    def get(
+        self, dpid: str, max_age: Optional[float] = None, now: Optional[float] = None
+    ):
+        """
+        :param dpid:
+        :param max_age: seconds, None accepts any age
+        :param now: time.monotonic()
+        :return: the value, None if unknown or older than max_age
+        """
+        if dpid not in self._values:
+            return None
+        if max_age is not None and self.age(dpid, now) > max_age:
+            return None
+        return self._values[dpid]
+
+    def snapshot(
+        self, max_age: Optional[float] = None, now: Optional[float] = None
+    ) -> Optional[dict]:
+        """
+        :param max_age: seconds every value must be younger than, None for any
+        :param now: time.monotonic()
+        :return: copy of all values, None if empty or too old
+        """
+        if not self._values:
+            return None
+        if max_age is not None and self.age(now=now) > max_age:
+            return None
+        return dict(self._values)
+
+
+# Home Assistant state writes done and skipped by DiffWriteMixin, all entities
+WRITE_STATS = {"written": 0, "suppressed": 0}
+
+
+class DiffWriteMixin:
+    """
+    Entity mixin writing Home Assistant state only when something changed.
+
+    Polls mostly find what the entity already shows; writing it again would
+    only load the recorder and the event bus.
+    """
+
+    _written_available: Optional[bool] = None
+    # writes skipped by this entity
+    suppressed_writes = 0
+
+    def async_write_if_changed(self, changed: bool) -> bool:
+        """
+        :param changed: the entity's attributes changed since its last write
+        :return: True if the state was written
+        """
+        if not changed and self.available == self._written_available:
+            self.suppressed_writes += 1
+            WRITE_STATS["suppressed"] += 1
+            return False
+        self.async_write_ha_state()
+        return True
+
+    def async_write_ha_state(self) -> None:
+        # every write, also the optimistic one of a command, is the baseline
+        # the next poll is compared with
+        self._written_available = self.available
+        WRITE_STATS["written"] += 1
+        super().async_write_ha_state()
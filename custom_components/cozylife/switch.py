@@ -13,26 +13,62 @@ from homeassistant.components.switch import PLATFORM_SCHEMA, SwitchEntity
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 
+from .const import (
+    CONF_POLL_CONCURRENCY,
+    CONF_POLL_INTERVAL_MAX,
+    CONF_POLL_INTERVAL_MIN,
+    CONF_POLL_TIMEOUT,
+    DOMAIN,
+    PID_CACHE_STORAGE_KEY,
+)
+from .poller import (
+    DEFAULT_POLL_CONCURRENCY,
+    DEFAULT_POLL_INTERVAL_MAX,
+    DEFAULT_POLL_INTERVAL_MIN,
+    DEFAULT_POLL_TIMEOUT,
+    AdaptivePollSchedule,
+    async_poll_all,
+)
+from .register import BitRegister
+from .registry import acquire_client, registered_clients, release_client
+from .services import async_register_services
+from .state import SHARED_QUERY_MAX_AGE, DiffWriteMixin
 from .tcp_client import tcp_client
+from .utils import PID_LIST_STORAGE_VERSION, pid_cache_store, set_pid_cache_store
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
         vol.Optional("switches", default=[]): vol.All(cv.ensure_list, [dict]),
         vol.Optional("switches2", default=[]): vol.All(cv.ensure_list, [dict]),
         vol.Optional("optimistic", default=False): cv.boolean,
+        vol.Optional(
+            CONF_POLL_CONCURRENCY, default=DEFAULT_POLL_CONCURRENCY
+        ): cv.positive_int,
+        vol.Optional(CONF_POLL_TIMEOUT, default=DEFAULT_POLL_TIMEOUT): vol.All(
+            vol.Coerce(float), vol.Range(min=0.1)
+        ),
+        vol.Optional(
+            CONF_POLL_INTERVAL_MIN, default=DEFAULT_POLL_INTERVAL_MIN
+        ): vol.All(vol.Coerce(float), vol.Range(min=1)),
+        vol.Optional(
+            CONF_POLL_INTERVAL_MAX, default=DEFAULT_POLL_INTERVAL_MAX
+        ): vol.All(vol.Coerce(float), vol.Range(min=1)),
     }
 )
 
-SCAN_INTERVAL = timedelta(seconds=10)
-
 _LOGGER = logging.getLogger(__name__)
 _LOGGER.info(__name__)
 
 # One lock per physical device (DPID '1' is a shared bitmask register),
 # so we must serialize query/control across both rockers.
 _DEVICE_LOCKS: dict[str, asyncio.Lock] = {}
+# Shared register '1' per physical device, batching the writes of all its rockers
+_REGISTERS: dict[str, BitRegister] = {}
+# bit of register '1' switched by each rocker
+_WIPPE_BITS = {"wippe1": 0x01, "wippe2": 0x02}
 
 
 async def async_setup_platform(
@@ -50,10 +86,22 @@ async def async_setup_platform(
     # if discovery_info is None:
     #    return
 
+    if pid_cache_store() is None:
+        set_pid_cache_store(
+            Store(hass, PID_LIST_STORAGE_VERSION, PID_CACHE_STORAGE_KEY)
+        )
+
     switches = []
     optimistic = config.get("optimistic", False)
+    poll_concurrency = config.get(CONF_POLL_CONCURRENCY, DEFAULT_POLL_CONCURRENCY)
+    poll_timeout = config.get(CONF_POLL_TIMEOUT, DEFAULT_POLL_TIMEOUT)
+    # each device is polled between these bounds, see AdaptivePollSchedule
+    schedule = AdaptivePollSchedule(
+        config.get(CONF_POLL_INTERVAL_MIN, DEFAULT_POLL_INTERVAL_MIN),
+        config.get(CONF_POLL_INTERVAL_MAX, DEFAULT_POLL_INTERVAL_MAX),
+    )
     for item in config.get("switches") or []:
-        client = tcp_client(item.get("ip"))
+        client = acquire_client(item.get("ip"), item.get("did"))
         client._device_id = item.get("did")
         client._pid = item.get("pid")
         client._dpid = item.get("dpid")
@@ -61,7 +109,9 @@ async def async_setup_platform(
         switches.append(CozyLifeSwitch(client, hass, "wippe1", optimistic))
 
     for item in config.get("switches2") or []:
-        client = tcp_client(item.get("ip"))
+        # one reference per entity, each releases its own on removal
+        client = acquire_client(item.get("ip"), item.get("did"))
+        acquire_client(item.get("ip"), item.get("did"))
         client._device_id = item.get("did")
         client._pid = item.get("pid")
         client._dpid = item.get("dpid")
@@ -72,49 +122,85 @@ async def async_setup_platform(
         switches.append(CozyLifeSwitch(client, hass, "wippe2", optimistic))
 
     async_add_devices(switches)
-    # Connect each unique tcp_client only once (switches2 creates two entities sharing one client)
+    # Connect each unique tcp_client only once (switches2 creates two entities sharing one client,
+    # and the registry shares clients with the light platform)
     unique_clients = {}
     for sw in switches:
         unique_clients[id(sw._tcp_client)] = sw._tcp_client
 
-    for client in unique_clients.values():
-        await client._connect()
+    async def async_start(client):
+        await client._ensure_connected()
         await client._device_info()
-        await asyncio.sleep(0.01)
+        # entities become available as soon as their device answers
+        for sw in switches:
+            if sw._tcp_client is client and sw.entity_id is not None:
+                sw.async_write_ha_state()
+
+    # Connect in the background so offline devices do not hold up HA startup
+    hass.async_create_background_task(
+        async_poll_all(
+            list(unique_clients.values()), async_start, poll_concurrency, poll_timeout
+        ),
+        f"{DOMAIN} switch startup",
+    )
+    async_register_services(hass)
+
+    async def async_query(client):
+        # Serialize query with the same lock used for control
+        device_key = (
+            getattr(client, "device_id", None)
+            or getattr(client, "_device_id", None)
+            or getattr(client, "ip", None)
+        )
+        lock = _DEVICE_LOCKS.setdefault(str(device_key), asyncio.Lock())
+        async with lock:
+            state = await client.query()
+        return state
 
     async def async_update(now=None):
         # Refresh once per physical device and fan-out the same state to all its entities
+        # State changes are pushed by the devices (cmd 10), polling is a safety net
+        # that only visits devices whose adaptive interval has elapsed.
+        # Due clients are queried concurrently, a failed or slow one yields None.
+        # Devices behind an open circuit breaker are left to the heartbeat probe.
+        clients = [
+            client
+            for client in schedule.due(unique_clients.values())
+            if client.breaker.closed
+        ]
+        states = await async_poll_all(
+            clients, async_query, poll_concurrency, poll_timeout
+        )
         client_to_state: dict[int, dict[str, Any] | None] = {}
+        for client, state in zip(clients, states):
+            schedule.record(client, state)
+            client_to_state[id(client)] = state
 
-        # Query each unique client once
-        for client in unique_clients.values():
-            # Serialize query with the same lock used for control
-            device_key = (
-                getattr(client, "device_id", None)
-                or getattr(client, "_device_id", None)
-                or getattr(client, "ip", None)
-            )
-            lock = _DEVICE_LOCKS.setdefault(str(device_key), asyncio.Lock())
-            async with lock:
-                try:
-                    client_to_state[id(client)] = await client.query()
-                except Exception:
-                    _LOGGER.exception("Failed to query CozyLife device %s", device_key)
-                    client_to_state[id(client)] = None
-            await asyncio.sleep(0.01)
-
-        # Apply state to all entities sharing the same client
+        # Apply state to all entities sharing a polled client
         for sw in switches:
-            sw._apply_state(client_to_state.get(id(sw._tcp_client)))
+            if id(sw._tcp_client) in client_to_state:
+                sw.async_write_if_changed(
+                    sw._apply_state(client_to_state[id(sw._tcp_client)])
+                )
 
     if not optimistic:
-        async_track_time_interval(hass, async_update, SCAN_INTERVAL)
+        async_track_time_interval(hass, async_update, timedelta(seconds=schedule.floor))
+        # any pushed state (e.g. the report after our own SET) means activity
+        # removed with the entities, the client may outlive this platform
+        for sw in switches:
+            sw.async_on_remove(
+                sw._tcp_client.add_listener(
+                    lambda state, client=sw._tcp_client: schedule.poke(client)
+                )
+            )
 
 
-class CozyLifeSwitch(SwitchEntity):
+class CozyLifeSwitch(DiffWriteMixin, SwitchEntity):
     _tcp_client = None
     _attr_is_on = True
     _wippe = None  # Add a new attribute to track the rocker
+    # refreshed by pushed state frames and the platform safety-net poll
+    _attr_should_poll = False
 
     def __init__(
         self, tcp_client: tcp_client, hass, wippe: str, optimistic: bool = False
@@ -132,6 +218,11 @@ class CozyLifeSwitch(SwitchEntity):
         # Shared lock across both rockers for the same physical device
         device_key = tcp_client.device_id
         self._lock = _DEVICE_LOCKS.setdefault(str(device_key), asyncio.Lock())
+        register = _REGISTERS.get(str(device_key))
+        if register is None or register._client is not tcp_client:
+            register = BitRegister(tcp_client, lock=self._lock)
+            _REGISTERS[str(device_key)] = register
+        self._register = register
 
     @property
     def unique_id(self) -> str | None:
@@ -142,39 +233,48 @@ class CozyLifeSwitch(SwitchEntity):
         if not self._optimistic:
             await self._refresh_state()
 
-    async def _refresh_state(self):
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        self.async_on_remove(self._tcp_client.add_listener(self._handle_push))
+
+    async def async_will_remove_from_hass(self) -> None:
+        await super().async_will_remove_from_hass()
+        # disconnects the device once no entity of any platform uses it
+        await release_client(self._tcp_client)
+        if self._tcp_client not in registered_clients():
+            self._register.cancel()
+            key = str(self._tcp_client.device_id)
+            if _REGISTERS.get(key) is self._register:
+                del _REGISTERS[key]
+
+    def _handle_push(self, state: dict[str, Any]) -> None:
+        """Apply a state frame pushed by the device."""
+        self.async_write_if_changed(self._apply_state(state))
+
+    async def _refresh_state(self) -> bool:
         async with self._lock:
-            state = await self._tcp_client.query()
-        self._apply_state(state)
+            # the other rocker of the device may have just asked
+            state = await self._tcp_client.query(max_age=SHARED_QUERY_MAX_AGE)
+        return self._apply_state(state)
 
-    def _apply_state(self, state: dict[str, Any] | None) -> None:
-        """Apply a device state payload to this entity (no I/O)."""
-        self._state = state
+    def _apply_state(self, state: dict[str, Any] | None) -> bool:
+        """
+        Apply a device state payload to this entity (no I/O)
+        :return: True if this rocker's state changed
+        """
+        if state is not None:
+            self._state = state
 
         if not self._state or "1" not in self._state:
-            return
+            return False
 
         reg = self._state["1"]
+        was_on = self._attr_is_on
         if self._wippe == "wippe1":
             self._attr_is_on = (reg & 0x01) == 0x01
         elif self._wippe == "wippe2":
             self._attr_is_on = (reg & 0x02) == 0x02
-
-    # ---------------------------------------------------------------------
-    # Helper: safely obtain current value of register '1'
-    # ---------------------------------------------------------------------
-    def _get_current_register_value(self) -> int:
-        """Return the current value of register '1' or 0 if unavailable.
-
-        We call _refresh_state if needed to avoid NoneType errors that were
-        crashing automations when self._state was None.
-        """
-        # if self._state is None:
-        #     self._refresh_state()  # Remove sync call in method
-
-        if self._state and "1" in self._state:
-            return self._state["1"]
-        return 0
+        return self._attr_is_on != was_on
 
     @property
     def name(self) -> str:
@@ -192,50 +292,22 @@ class CozyLifeSwitch(SwitchEntity):
 
     async def async_turn_on(self, **kwargs: Any) -> None:
         """Turn the entity on."""
-        async with self._lock:
-            # Always refresh before read-modify-write on shared register '1'
-            state = await self._tcp_client.query()
-            self._apply_state(state)
-            current = self._get_current_register_value()
-
-            _LOGGER.info(
-                "turn_on:%s  current=0x%02X  wippe=%s", kwargs, current, self._wippe
-            )
-
-            if self._wippe == "wippe1":
-                new_val = current | 0x01
-            else:  # wippe2
-                new_val = current | 0x02
-
-            await self._tcp_client.control({"1": new_val})
-
-            # Update local cached register to avoid stale next operations
-            if self._state is None:
-                self._state = {}
-            self._state["1"] = new_val
+        self._tcp_client.log.debug("turn_on:%s  wippe=%s", kwargs, self._wippe)
+        # merged with the other rockers' writes into one read-modify-write of '1'
+        value = await self._register.write(set_bits=_WIPPE_BITS[self._wippe])
+        if value is not None:
+            self._state = self._tcp_client.state.snapshot()
 
         # Optimistically set state flag (actual bit will be re-applied on next refresh)
         self._attr_is_on = True
+        self.async_write_ha_state()
 
     async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn the entity off."""
-        async with self._lock:
-            # Always refresh before read-modify-write on shared register '1'
-            state = await self._tcp_client.query()
-            self._apply_state(state)
-            current = self._get_current_register_value()
-
-            _LOGGER.info("turn_off  current=0x%02X  wippe=%s", current, self._wippe)
-
-            if self._wippe == "wippe1":
-                new_val = current & ~0x01
-            else:  # wippe2
-                new_val = current & ~0x02
-
-            await self._tcp_client.control({"1": new_val})
-
-            if self._state is None:
-                self._state = {}
-            self._state["1"] = new_val
+        self._tcp_client.log.debug("turn_off  wippe=%s", self._wippe)
+        value = await self._register.write(clear_bits=_WIPPE_BITS[self._wippe])
+        if value is not None:
+            self._state = self._tcp_client.state.snapshot()
 
         self._attr_is_on = False
+        self.async_write_ha_state()
@@ -1,18 +1,44 @@
 # -*- coding: utf-8 -*-
 import asyncio
-import json
 import logging
-from typing import Any, Optional, Union
+import time
+from typing import Any, Callable, Optional, Union
 
 try:
-    from .utils import get_pid_list, get_sn
+    from .catalog import async_lookup_pid, async_schedule_cloud_refresh
+    from .connection import CircuitBreaker, get_connection_manager
+    from .devlog import DeviceLogger
+    from .metrics import ClientMetrics
+    from .packet import (  # noqa: F401
+        CMD_INFO,
+        CMD_LIST,
+        CMD_QUERY,
+        CMD_REPORT,
+        CMD_SET,
+        READ_CHUNK,
+        FrameDecoder,
+        encode_packet,
+    )
+    from .state import SOURCE_POLL, SOURCE_PUSH, SOURCE_WRITE, DeviceStateStore
+    from .utils import SnGenerator
 except ImportError:
-    from utils import get_pid_list, get_sn
+    from catalog import async_lookup_pid, async_schedule_cloud_refresh
+    from connection import CircuitBreaker, get_connection_manager
+    from devlog import DeviceLogger
+    from metrics import ClientMetrics
+    from packet import (  # noqa: F401
+        CMD_INFO,
+        CMD_LIST,
+        CMD_QUERY,
+        CMD_REPORT,
+        CMD_SET,
+        READ_CHUNK,
+        FrameDecoder,
+        encode_packet,
+    )
+    from state import SOURCE_POLL, SOURCE_PUSH, SOURCE_WRITE, DeviceStateStore
+    from utils import SnGenerator
 
-CMD_INFO = 0
-CMD_QUERY = 2
-CMD_SET = 3
-CMD_LIST = [CMD_INFO, CMD_QUERY, CMD_SET]
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -47,16 +73,47 @@ class tcp_client(object):
     _dpid = []
     # last sn
     _sn = None
-    _heartbeat_task: Optional[asyncio.Task] = None
+    # time.monotonic() the device last sent a frame
+    last_activity = 0.0
+    _pid_task: Optional[asyncio.Task] = None
+    # the only task reading from _reader while connected
+    _reader_task: Optional[asyncio.Task] = None
 
     def __init__(self, ip, timeout=3):
         self._ip = ip
         self.timeout = timeout
-        self._heartbeat_task = None
+        self._reader_task = None
+        # lazily formatted, per-device debug and sampled frame logging
+        self.log = DeviceLogger(_LOGGER, ip)
+        # sn -> future resolved with the reply frame by _read_loop
+        self._pending: dict[str, asyncio.Future] = {}
+        self._sn_generator = SnGenerator()
+        # last known dpid values, from polls, pushes and acked writes
+        self.state = DeviceStateStore()
+        # protocol counters and latencies, see build_diagnostics
+        self.metrics = ClientMetrics()
+        # fails connects fast while the device is unreachable
+        self.breaker = CircuitBreaker()
+        # callbacks fed with the data of state frames nobody asked for
+        self._listeners: list[Callable[[dict], None]] = []
+        # SET waiting for the one in flight: merged payload and its ack future
+        self._coalesced_payload: Optional[dict] = None
+        self._coalesced_future: Optional[asyncio.Future] = None
+        self._coalesce_task: Optional[asyncio.Task] = None
+        # the connect attempt every caller finding the client down waits for
+        self._connect_task: Optional[asyncio.Task] = None
 
     async def disconnect(self):
-        if self._heartbeat_task and not self._heartbeat_task.done():
-            self._heartbeat_task.cancel()
+        get_connection_manager().unregister(self)
+        await self._close_connection()
+        self._fail_pending(ConnectionError(f"{self._ip} disconnected"))
+
+    async def _close_connection(self):
+        """Close the socket and stop its reader, keeping pending requests."""
+        if self._reader_task and not self._reader_task.done():
+            if self._reader_task is not asyncio.current_task():
+                self._reader_task.cancel()
+        self._reader_task = None
         if self._writer:
             try:
                 self._writer.close()
@@ -65,7 +122,85 @@ class tcp_client(object):
                 pass
         self._reader = None
         self._writer = None
-        self._heartbeat_task = None
+
+    def _fail_pending(self, exc: Exception) -> None:
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        """
+        Decode every frame of the connection once and hand it to its requester
+        :param reader:
+        :return:
+        """
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(READ_CHUNK)
+                if not data:
+                    break
+                self.metrics.bytes_in += len(data)
+                dropped = decoder.dropped
+                frames = decoder.feed(data)
+                self.metrics.discarded_lines += decoder.dropped - dropped
+                if frames:
+                    self.last_activity = time.monotonic()
+                log_frames = self.log.debug_enabled
+                for frame in frames:
+                    if log_frames:
+                        self.log.frame("<-", frame)
+                    future = self._pending.pop(str(frame.get("sn")), None)
+                    if future is not None and not future.done():
+                        future.set_result(frame)
+                    else:
+                        if frame.get("cmd") in (CMD_INFO, CMD_QUERY):
+                            # a reply nobody waits for any more, e.g. after a timeout
+                            self.metrics.sn_mismatches += 1
+                        self._handle_unsolicited(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.log.info("_read_loop.error: %s", e)
+        # the device closed the socket: fail fast instead of waiting for timeouts
+        if self._reader is reader:
+            await self._close_connection()
+            self._fail_pending(ConnectionError(f"{self._ip} closed the connection"))
+
+    def _handle_unsolicited(self, frame: dict) -> None:
+        """
+        frame nobody is waiting for, e.g. cmd 10 state report or a late reply
+        :param frame:
+        :return:
+        """
+        self.log.debug("unsolicited frame %s", frame)
+        if frame.get("cmd") == CMD_SET:
+            # ack of a control_nowait frame, it only echoes what we wrote
+            return
+        msg = frame.get("msg")
+        if not isinstance(msg, dict) or not isinstance(msg.get("data"), dict):
+            return
+        self.state.update(msg["data"], SOURCE_PUSH)
+        for listener in list(self._listeners):
+            try:
+                listener(msg["data"])
+            except Exception:
+                _LOGGER.exception("Error in state listener for %s", self._ip)
+
+    def add_listener(self, listener: Callable[[dict], None]) -> Callable[[], None]:
+        """
+        Call listener with the attribute data of every pushed state frame
+        :param listener:
+        :return: function removing the listener
+        """
+        self._listeners.append(listener)
+
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
 
     def __del__(self):
         # Note: __del__ cannot be async, but we can close synchronously if needed
@@ -73,80 +208,63 @@ class tcp_client(object):
             self._writer.close()
 
     def _start_heartbeat(self):
-        """Start the heartbeat task if not already running."""
-        if self._heartbeat_task is None or self._heartbeat_task.done():
-            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        """Have the shared connection manager keep this device alive."""
+        get_connection_manager().register(self)
 
     async def _ping(self) -> None:
         """Send a ping to check connection and clear response buffer."""
         # Send CMD_INFO and read a single response line to avoid buffer accumulation
         if not await self._ensure_connected():
             raise ConnectionError("Ping failed: not connected")
-        self._writer.write(self._get_package(CMD_INFO, {}))
-        await self._writer.drain()
-        await asyncio.wait_for(self._reader.readline(), timeout=self.timeout)
-
-    async def _heartbeat(self):
-        """Heartbeat task to maintain connection."""
-        while True:
-            await asyncio.sleep(30)  # Check every 30 seconds
-            if not self.available:
-                _LOGGER.info(
-                    f"Heartbeat: Connection not available for {self._ip}, attempting reconnect"
-                )
-                try:
-                    await self._connect()
-                    if self.available:
-                        _LOGGER.info(f"Heartbeat: Reconnected to {self._ip}")
-                    else:
-                        _LOGGER.warning(f"Heartbeat: Failed to reconnect to {self._ip}")
-                except Exception as e:
-                    _LOGGER.warning(f"Heartbeat: Reconnect failed for {self._ip}: {e}")
-                continue
-            try:
-                # Send a ping to verify connection is alive
-                await self._ping()
-            except Exception as e:
-                _LOGGER.info(
-                    f"Heartbeat: Ping failed for {self._ip} ({e}), attempting reconnect"
-                )
-                try:
-                    await self._connect()
-                    if self.available:
-                        _LOGGER.info(f"Heartbeat: Reconnected to {self._ip}")
-                    else:
-                        _LOGGER.warning(f"Heartbeat: Failed to reconnect to {self._ip}")
-                except Exception as e2:
-                    _LOGGER.warning(f"Heartbeat: Reconnect failed for {self._ip}: {e2}")
+        if await self._request(CMD_INFO, {}) is None:
+            raise ConnectionError("Ping failed: no reply")
 
     async def _ensure_connected(self):
         """Ensure device is connected, attempt reconnect if needed."""
-        if not self.available:
-            _LOGGER.info(f"Ensuring connection for {self._ip}")
-            try:
-                await self._connect()
-                if self.available:
-                    _LOGGER.info(f"Reconnected to {self._ip}")
-                    # Start heartbeat if not running
-                    self._start_heartbeat()
-                else:
-                    _LOGGER.warning(f"Failed to reconnect to {self._ip}")
-                    return False
-            except Exception as e:
-                _LOGGER.warning(f"Reconnect failed for {self._ip}: {e}")
+        if self.available:
+            return True
+        if self._connect_task is None:
+            if not self.breaker.allow():
+                # known to be gone: fail fast until the breaker lets a probe through
                 return False
-        return True
+            self._connect_task = asyncio.create_task(self._reconnect())
+        # one attempt, counted once by the breaker, for all concurrent callers;
+        # a caller giving up must not cancel it for the others
+        return await asyncio.shield(self._connect_task)
+
+    async def _reconnect(self) -> bool:
+        self.log.info("ensuring connection")
+        connected = False
+        try:
+            await self._connect()
+            connected = self.available
+        except Exception as e:
+            self.log.warning("reconnect failed: %s", e)
+        finally:
+            self._connect_task = None
+            if connected:
+                self.breaker.record_success()
+                self.log.info("reconnected")
+            else:
+                self.breaker.record_failure()
+                self.log.warning("failed to reconnect, breaker %s", self.breaker.state)
+        return connected
 
     async def _connect(self):
+        # kept alive (and retried while unreachable) until disconnect()
+        self._start_heartbeat()
         try:
+            await self._close_connection()
             self._reader, self._writer = await asyncio.open_connection(
                 self._ip, self._port
             )
-            # Start heartbeat after successful connection
-            self._start_heartbeat()
+            self._reader_task = asyncio.create_task(self._read_loop(self._reader))
+            self.metrics.connects += 1
         except Exception as e:
-            _LOGGER.info(f"_connect error, ip={self._ip}: {e}")
-            await self.disconnect()
+            self.metrics.connect_failures += 1
+            self.log.info("_connect error: %s", e)
+            await self._close_connection()
+            self._fail_pending(ConnectionError(f"{self._ip} unreachable"))
 
     @property
     def check(self) -> bool:
@@ -186,70 +304,61 @@ class tcp_client(object):
         get info for device model
         :return:
         """
-        if not await self._ensure_connected():
-            return
-        package = self._get_package(CMD_INFO, {})
-        try:
-            self._writer.write(package)
-            await self._writer.drain()
-        except Exception:
-            try:
-                await self.disconnect()
-                await self._connect()
-                if self._writer:
-                    self._writer.write(package)
-                    await self._writer.drain()
-            except Exception:
-                return
-
-        try:
-            resp = await asyncio.wait_for(self._reader.read(1024), timeout=self.timeout)
-            if not resp:
-                return
-            resp_json = json.loads(resp.strip())
-        except asyncio.TimeoutError:
-            _LOGGER.info("_device_info: timeout")
-            return
-        except Exception:
-            _LOGGER.info("_device_info.recv.error")
+        resp_json = await self._request(CMD_INFO, {})
+        if resp_json is None:
+            self.log.info("_device_info: no reply")
             return
 
         if resp_json.get("msg") is None or type(resp_json["msg"]) is not dict:
-            _LOGGER.info("_device_info.recv.error1")
+            self.log.info("_device_info.recv.error1")
             return
 
         if resp_json["msg"].get("did") is None:
-            _LOGGER.info("_device_info.recv.error2")
+            self.log.info("_device_info.recv.error2")
             return
         self._device_id = resp_json["msg"]["did"]
+        self.log.did = self._device_id
 
         if resp_json["msg"].get("pid") is None:
-            _LOGGER.info("_device_info.recv.error3")
+            self.log.info("_device_info.recv.error3")
             return
 
         self._pid = resp_json["msg"]["pid"]
 
-        pid_list = await get_pid_list()
-        for item in pid_list:
-            match = False
-            for item1 in item["device_model"]:
-                if item1["device_product_id"] == self._pid:
-                    match = True
-                    self._icon = item1["icon"]
-                    self._device_model_name = item1["device_model_name"]
-                    self._dpid = item1["dpid"]
-                    break
+        info = await async_lookup_pid(self._pid)
+        if info is not None:
+            self._apply_pid_info(info)
+        else:
+            # unknown to the bundled catalog, learn it from the cloud without
+            # holding up the caller
+            self._pid_task = asyncio.create_task(self._resolve_pid_from_cloud())
+
+        self.log.debug(
+            "_device_info: did=%s, type=%s, pid=%s, model=%s, icon=%s",
+            self._device_id,
+            self._device_type_code,
+            self._pid,
+            self._device_model_name,
+            self._icon,
+        )
 
-            if match:
-                self._device_type_code = item["device_type_code"]
-                break
+    def _apply_pid_info(self, info) -> None:
+        self._device_type_code = info.device_type_code
+        self._device_model_name = info.device_model_name
+        self._icon = info.icon
+        self._dpid = info.dpid
 
-        # _LOGGER.info(pid_list)
-        _LOGGER.info(self._device_id)
-        _LOGGER.info(self._device_type_code)
-        _LOGGER.info(self._pid)
-        _LOGGER.info(self._device_model_name)
-        _LOGGER.info(self._icon)
+    async def _resolve_pid_from_cloud(self) -> None:
+        """
+        look up a pid missing from model.json in the cloud catalog
+        :return:
+        """
+        await async_schedule_cloud_refresh()
+        info = await async_lookup_pid(self._pid)
+        if info is None:
+            self.log.info("_device_info: unknown pid %s", self._pid)
+            return
+        self._apply_pid_info(info)
 
     def _get_package(self, cmd: int, payload: dict) -> bytes:
         """
@@ -258,98 +367,93 @@ class tcp_client(object):
         :param payload:
         :return:
         """
-        self._sn = get_sn()
-        if CMD_SET == cmd:
-            message = {
-                "pv": 0,
-                "cmd": cmd,
-                "sn": self._sn,
-                "msg": {
-                    "attr": [int(item) for item in payload.keys()],
-                    "data": payload,
-                },
-            }
-        elif CMD_QUERY == cmd:
-            message = {
-                "pv": 0,
-                "cmd": cmd,
-                "sn": self._sn,
-                "msg": {
-                    "attr": [0],
-                },
-            }
-        elif CMD_INFO == cmd:
-            message = {"pv": 0, "cmd": cmd, "sn": self._sn, "msg": {}}
-        else:
-            raise Exception("CMD is not valid")
-
-        payload_str = json.dumps(
-            message,
-            separators=(
-                ",",
-                ":",
-            ),
-        )
-        # _LOGGER.info(f'_package={payload_str}')
-        return bytes(payload_str + "\r\n", encoding="utf8")
+        self._sn = self._sn_generator.next(self._pending)
+        return encode_packet(cmd, self._sn, payload)
 
-    async def _send_receiver(self, cmd: int, payload: dict) -> Union[dict, Any]:
+    async def _write(self, package: bytes) -> bool:
         """
-        send & receiver
-        :param cmd:
-        :param payload:
-        :return:
+        write a package, reconnecting once if the socket turned out dead
+        :param package:
+        :return: True if the package was handed to the transport
         """
-        if not await self._ensure_connected():
-            return None
+        self.log.frame("->", package)
         try:
-            self._writer.write(self._get_package(cmd, payload))
+            self._writer.write(package)
             await self._writer.drain()
+            self.metrics.bytes_out += len(package)
+            return True
         except Exception:
             try:
-                await self.disconnect()
-                await self._connect()
-                if self._writer:
-                    self._writer.write(self._get_package(cmd, payload))
+                await self._close_connection()
+                # the breaker fails this fast while the device is known gone
+                if await self._ensure_connected():
+                    self._writer.write(package)
                     await self._writer.drain()
+                    self.metrics.bytes_out += len(package)
+                    return True
             except Exception:
                 pass
+        return False
+
+    async def _request(self, cmd: int, payload: dict) -> Optional[dict]:
+        """
+        send a package and wait for the reply frame carrying the same sn
+        :param cmd:
+        :param payload:
+        :return: reply frame, None on timeout or connection failure
+        """
+        if not await self._ensure_connected():
+            return None
+        package = self._get_package(cmd, payload)
+        sn = self._sn
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # registered before writing, the reply may arrive during drain()
+        self._pending[sn] = future
+        self.metrics.requests[cmd] += 1
+        started = loop.time()
         try:
-            i = 10
-            while i > 0:
-                try:
-                    res = await asyncio.wait_for(
-                        self._reader.readline(), timeout=self.timeout
-                    )
-                except asyncio.TimeoutError:
-                    i -= 1
-                    continue
-                # print(f'res={res},sn={self._sn},{self._sn in str(res)}')
-                i -= 1
-                # only allow same sn
-                if self._sn in res.decode("utf-8"):
-                    payload = json.loads(res.strip())
-                    if payload is None or len(payload) == 0:
-                        return None
-
-                    if payload.get("msg") is None or type(payload["msg"]) is not dict:
-                        return None
-
-                    if (
-                        payload["msg"].get("data") is None
-                        or type(payload["msg"]["data"]) is not dict
-                    ):
-                        return None
-
-                    return payload["msg"]["data"]
+            if not await self._write(package):
+                return None
+            reply = await asyncio.wait_for(future, timeout=self.timeout)
+            self.metrics.observe_request(cmd, (loop.time() - started) * 1000)
+            return reply
+        except asyncio.TimeoutError:
+            self.metrics.timeouts[cmd] += 1
+            self.log.info("_request: timeout, cmd=%s, sn=%s", cmd, sn)
+            return None
+        except ConnectionError as e:
+            self.log.info("_request.error: %s", e)
+            return None
+        finally:
+            if self._pending.get(sn) is future:
+                del self._pending[sn]
+            if future.done() and not future.cancelled():
+                # failed by a reconnect while we were still writing
+                future.exception()
 
+    async def _send_receiver(self, cmd: int, payload: dict) -> Union[dict, Any]:
+        """
+        send & receiver
+        :param cmd:
+        :param payload:
+        :return:
+        """
+        payload = await self._request(cmd, payload)
+        if payload is None or len(payload) == 0:
             return None
 
-        except Exception as e:
-            # print(f'e={e}')
-            _LOGGER.info(f"_send_receiver.error:{e}")
+        if payload.get("msg") is None or type(payload["msg"]) is not dict:
+            return None
+
+        if (
+            payload["msg"].get("data") is None
+            or type(payload["msg"]["data"]) is not dict
+        ):
             return None
 
+        return payload["msg"]["data"]
+
     async def _only_send(self, cmd: int, payload: dict) -> None:
         """
         send but not receiver
@@ -359,18 +463,10 @@ class tcp_client(object):
         """
         if not await self._ensure_connected():
             return
-        try:
-            self._writer.write(self._get_package(cmd, payload))
-            await self._writer.drain()
-        except Exception:
-            try:
-                await self.disconnect()
-                await self._connect()
-                if self._writer:
-                    self._writer.write(self._get_package(cmd, payload))
-                    await self._writer.drain()
-            except Exception:
-                await self.disconnect()
+        if not await self._write(self._get_package(cmd, payload)):
+            # the heartbeat reconnects it, only an explicit disconnect() unregisters
+            await self._close_connection()
+            self._fail_pending(ConnectionError(f"{self._ip} write failed"))
 
     async def _send_receive_ack(self, cmd: int, payload: dict) -> bool:
         """
@@ -379,42 +475,11 @@ class tcp_client(object):
         :param payload:
         :return:
         """
-        if not await self._ensure_connected():
-            return False
-        try:
-            self._writer.write(self._get_package(cmd, payload))
-            await self._writer.drain()
-        except Exception:
-            try:
-                await self.disconnect()
-                await self._connect()
-                if self._writer:
-                    self._writer.write(self._get_package(cmd, payload))
-                    await self._writer.drain()
-            except Exception:
-                pass
-        try:
-            i = 10
-            while i > 0:
-                try:
-                    res = await asyncio.wait_for(
-                        self._reader.readline(), timeout=self.timeout
-                    )
-                except asyncio.TimeoutError:
-                    i -= 1
-                    continue
-                i -= 1
-                # only allow same sn
-                if self._sn in res.decode("utf-8"):
-                    payload = json.loads(res.strip())
-                    if payload is None or len(payload) == 0:
-                        return False
-                    # For SET command, just check that we got a response
-                    return payload.get("res", -1) == 0
-            return False
-        except Exception as e:
-            _LOGGER.info(f"_send_receive_ack.error:{e}")
+        payload = await self._request(cmd, payload)
+        if payload is None or len(payload) == 0:
             return False
+        # For SET command, just check that we got a response
+        return payload.get("res", -1) == 0
 
     async def control(self, payload: dict) -> bool:
         """
@@ -422,11 +487,60 @@ class tcp_client(object):
         :param payload:
         :return:
         """
-        return await self._send_receive_ack(CMD_SET, payload)
+        if not await self._send_receive_ack(CMD_SET, payload):
+            return False
+        self.state.update(payload, SOURCE_WRITE)
+        return True
+
+    async def control_nowait(self, payload: dict) -> None:
+        """
+        control without waiting for the ack (pipelined), for frames that a
+        later, confirmed control supersedes anyway
+        :param payload:
+        :return:
+        """
+        await self._only_send(CMD_SET, payload)
+
+    async def control_coalesced(self, payload: dict) -> bool:
+        """
+        control, merged with other calls made while a SET is in flight.
+        At most one SET per round trip goes to the device, each dpid carries
+        the latest value written (last writer wins).
+        :param payload:
+        :return: ack of the SET that carried this payload
+        """
+        if self._coalesced_future is None:
+            self._coalesced_payload = {}
+            self._coalesced_future = asyncio.get_running_loop().create_future()
+        self._coalesced_payload.update(payload)
+        future = self._coalesced_future
+        if self._coalesce_task is None or self._coalesce_task.done():
+            self._coalesce_task = asyncio.create_task(self._flush_coalesced())
+        return await asyncio.shield(future)
+
+    async def _flush_coalesced(self) -> None:
+        while self._coalesced_future is not None:
+            payload, future = self._coalesced_payload, self._coalesced_future
+            self._coalesced_payload = self._coalesced_future = None
+            try:
+                result = await self.control(payload)
+            except Exception:
+                _LOGGER.exception("control_coalesced failed for %s", self._ip)
+                result = False
+            if not future.done():
+                future.set_result(result)
 
-    async def query(self) -> dict:
+    async def query(self, max_age: Optional[float] = None) -> dict:
         """
         query device state
+        :param max_age: seconds, answer from the state store if every value is
+            at most this old instead of asking the device
         :return:
         """
-        return await self._send_receiver(CMD_QUERY, {})
+        if max_age is not None:
+            cached = self.state.snapshot(max_age)
+            if cached is not None:
+                return cached
+        data = await self._send_receiver(CMD_QUERY, {})
+        self.state.update(data, SOURCE_POLL)
+        return data
@@ -0,0 +1,388 @@
+"""Light fades run as background tasks on a monotonic clock."""
+
+import asyncio
+import logging
+import math
+import time
+from array import array
+from typing import Awaitable, Callable, Iterable, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# seconds between two frames of a fade
+DEFAULT_FRAME_INTERVAL = 0.1
+# fades of equal duration started within this many seconds run as one group
+GROUP_WINDOW = 0.02
+# exponent of the perceptual brightness curve
+DEFAULT_GAMMA = 2.2
+
+# progress 0..1 -> eased progress 0..1, written with plain arithmetic so the
+# same function works on a float and on a numpy array
+EASINGS = {
+    "linear": lambda p: p,
+    "ease_in": lambda p: p * p,
+    "ease_out": lambda p: 1 - (1 - p) * (1 - p),
+    "ease_in_out": lambda p: p * p * (3 - 2 * p),
+}
+
+
+def interpolate(start: dict, end: dict, progress: float) -> dict:
+    """
+    Values between start and end, for every dpid of end
+    :param start: dpid -> value at progress 0
+    :param end: dpid -> value at progress 1
+    :param progress: 0..1
+    :return: dpid -> int
+    """
+    return {
+        dpid: round(start[dpid] + (value - start[dpid]) * progress)
+        for dpid, value in end.items()
+    }
+
+
+class FrameBuffer:
+    """
+    Precomputed frames of a fade, one row of dpid values per tick.
+
+    Values are kept in one flat integer buffer (a numpy array when numpy is
+    available, an array.array otherwise); frames are only built as dicts when
+    the send loop asks for them.
+    """
+
+    def __init__(self, base: dict, dpids: tuple, values) -> None:
+        self.base = base
+        self.dpids = dpids
+        self._values = values
+        self._width = len(dpids)
+
+    def __len__(self) -> int:
+        return len(self._values) // self._width if self._width else 0
+
+    def row(self, index: int) -> tuple:
+        """
+        :param index: tick
+        :return: values of the tick in dpids order
+        """
+        offset = index * self._width
+        return tuple(int(v) for v in self._values[offset : offset + self._width])
+
+    def __getitem__(self, index: int) -> dict:
+        return {**self.base, **dict(zip(self.dpids, self.row(index)))}
+
+
+def compute_frames(
+    base: dict,
+    start: dict,
+    end: dict,
+    steps: int,
+    easing: str = "linear",
+    gamma_dpids: Iterable[str] = (),
+    gamma: float = DEFAULT_GAMMA,
+) -> FrameBuffer:
+    """
+    Build every frame of a fade in one pass
+    :param base: dpids sent unchanged with every frame
+    :param start: dpid -> value at the beginning
+    :param end: dpid -> value at the end
+    :param steps: number of frames, frame i is at progress i / steps
+    :param easing: key of EASINGS
+    :param gamma_dpids: dpids ramped in perceived rather than raw value, e.g. brightness
+    :param gamma: exponent of the perceptual curve
+    :return: FrameBuffer
+    """
+    ease = EASINGS[easing]
+    dpids = tuple(end)
+    gamma_dpids = set(gamma_dpids)
+
+    if np is not None:
+        progress = ease(np.arange(steps, dtype=np.float64) / steps)
+        columns = []
+        for dpid in dpids:
+            a, b = start[dpid], end[dpid]
+            if dpid in gamma_dpids:
+                a, b = a ** (1 / gamma), b ** (1 / gamma)
+                columns.append((a + (b - a) * progress) ** gamma)
+            else:
+                columns.append(a + (b - a) * progress)
+        # row major: the values of one frame are next to each other
+        values = np.rint(np.column_stack(columns)).astype(np.int64).ravel()
+        return FrameBuffer(base, dpids, values)
+
+    values = array("q")
+    ramps = []
+    for dpid in dpids:
+        a, b = start[dpid], end[dpid]
+        if dpid in gamma_dpids:
+            ramps.append((a ** (1 / gamma), b ** (1 / gamma), gamma))
+        else:
+            ramps.append((a, b, 1))
+    for step in range(steps):
+        p = ease(step / steps)
+        for a, b, exponent in ramps:
+            value = a + (b - a) * p
+            values.append(round(value**exponent if exponent != 1 else value))
+    return FrameBuffer(base, dpids, values)
+
+
+class TransitionEngine:
+    """
+    At most one fade per device, run by a TransitionGroup.
+
+    Frames are due on a fixed grid of frame_interval seconds from the start of
+    the fade and are looked up by the clock when they are sent. Frames that
+    fall due while the previous send is still in progress are skipped, so a
+    fade lasts its duration whatever the device latency.
+
+    Intermediate frames go through send, which need not wait for an ack;
+    only the final frame goes through confirm.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[dict], Awaitable],
+        confirm: Optional[Callable[[dict], Awaitable]] = None,
+        frame_interval: float = DEFAULT_FRAME_INTERVAL,
+    ) -> None:
+        self._send = send
+        self._confirm = confirm or send
+        self.frame_interval = frame_interval
+        # group fade this device takes part in, see TransitionGroup
+        self._group: Optional["TransitionGroup"] = None
+        # time.time() the running fade started, 0 when idle
+        self.started_at = 0
+
+    @property
+    def running(self) -> bool:
+        return self._group is not None
+
+    def cancel(self) -> None:
+        """Stop the running fade, the device keeps its last frame."""
+        if self._group is not None:
+            # the rest of the group carries on without us
+            self._group.discard(self)
+            self._group = None
+        self.started_at = 0
+
+    def start(
+        self,
+        base: dict,
+        start: dict,
+        end: dict,
+        duration: float,
+        final: Optional[dict] = None,
+        on_done: Optional[Callable[[], Awaitable]] = None,
+        easing: str = "linear",
+        gamma_dpids: Iterable[str] = (),
+    ) -> asyncio.Task:
+        """
+        Fade the dpids of end from start in duration seconds, replacing any running fade
+        :param base: dpids sent unchanged with every frame
+        :param start: dpid -> value at the beginning
+        :param end: dpid -> value at the end
+        :param duration: seconds
+        :param final: last frame, defaults to base + end
+        :param on_done: awaited after the final frame, e.g. to read back the state
+        :param easing: key of EASINGS
+        :param gamma_dpids: dpids ramped perceptually, see compute_frames
+        :return: the fade task
+        """
+        group = TransitionGroup(duration, self.frame_interval)
+        group.add(self, base, start, end, final, on_done, easing, gamma_dpids)
+        return group.start()
+
+
+class TransitionGroup:
+    """
+    One fade for many devices, driven by a single clock.
+
+    Every member's frames are computed up front (see compute_frames). On each tick the frames of
+    all members are sent concurrently, so the devices stay in step instead of
+    rippling one after the other. Members can leave (TransitionEngine.cancel)
+    while the others carry on.
+    """
+
+    def __init__(
+        self, duration: float, frame_interval: float = DEFAULT_FRAME_INTERVAL
+    ) -> None:
+        self.duration = duration
+        self.frame_interval = frame_interval
+        # number of ticks before the final frame
+        self.ticks = max(1, math.ceil(duration / frame_interval))
+        # engine -> (FrameBuffer, final, on_done)
+        self._members: dict = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(
+        self,
+        engine: TransitionEngine,
+        base: dict,
+        start: dict,
+        end: dict,
+        final: Optional[dict] = None,
+        on_done: Optional[Callable[[], Awaitable]] = None,
+        easing: str = "linear",
+        gamma_dpids: Iterable[str] = (),
+    ) -> None:
+        """
+        Add a device, replacing any fade it is running
+        :param engine: the device's engine, provides send and confirm
+        :param base: dpids sent unchanged with every frame
+        :param start: dpid -> value at the beginning
+        :param end: dpid -> value at the end
+        :param final: last frame, defaults to base + end
+        :param on_done: awaited after the final frame
+        :param easing: key of EASINGS
+        :param gamma_dpids: dpids ramped perceptually, see compute_frames
+        """
+        engine.cancel()
+        frames = compute_frames(base, start, end, self.ticks, easing, gamma_dpids)
+        self._members[engine] = (frames, final or {**base, **end}, on_done)
+        engine._group = self
+        engine.started_at = time.time()
+
+    def discard(self, engine: TransitionEngine) -> None:
+        self._members.pop(engine, None)
+        if (
+            not self._members
+            and self._task is not None
+            and self._task is not asyncio.current_task()
+        ):
+            # nobody left to fade
+            self._task.cancel()
+
+    @property
+    def done(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        last_rows: dict = {}
+        try:
+            while True:
+                # frames are indexed by time, ticks missed while sending are skipped
+                tick = int((loop.time() - started) / self.frame_interval)
+                if tick >= self.ticks or not self._members:
+                    break
+                sends = []
+                for engine, (frames, _, _) in list(self._members.items()):
+                    row = frames.row(tick)
+                    if last_rows.get(engine) != row:
+                        last_rows[engine] = row
+                        sends.append(engine._send(frames[tick]))
+                await asyncio.gather(*sends, return_exceptions=True)
+                await asyncio.sleep(
+                    max(0, started + (tick + 1) * self.frame_interval - loop.time())
+                )
+            members = list(self._members.items())
+            await asyncio.gather(
+                *(engine._confirm(final) for engine, (_, final, _) in members),
+                return_exceptions=True,
+            )
+            await asyncio.gather(
+                *(on_done() for _, (_, _, on_done) in members if on_done),
+                return_exceptions=True,
+            )
+            _LOGGER.debug(
+                "group fade of %ss for %d devices done in %.2fs",
+                self.duration,
+                len(members),
+                loop.time() - started,
+            )
+        finally:
+            for engine in list(self._members):
+                if engine._group is self:
+                    engine._group = None
+                    engine.started_at = 0
+            self._members.clear()
+
+
+class TransitionCoordinator:
+    """
+    Runs fades started at nearly the same time, e.g. by one service call for
+    a room full of lights, as one TransitionGroup per duration.
+
+    A group starts on the next loop iteration and takes further fades of its
+    duration for window seconds; latecomers pick up at the current tick, so a
+    lone fade is not held back.
+    """
+
+    def __init__(
+        self,
+        frame_interval: float = DEFAULT_FRAME_INTERVAL,
+        window: float = GROUP_WINDOW,
+    ) -> None:
+        self.frame_interval = frame_interval
+        self.window = window
+        # duration -> (group still accepting members, handle closing it)
+        self._forming: dict = {}
+        # groups running or about to, cancelled by cancel_all
+        self._groups: set = set()
+
+    def start(
+        self,
+        engine: TransitionEngine,
+        base: dict,
+        start: dict,
+        end: dict,
+        duration: float,
+        final: Optional[dict] = None,
+        on_done: Optional[Callable[[], Awaitable]] = None,
+        easing: str = "linear",
+        gamma_dpids: Iterable[str] = (),
+    ) -> TransitionGroup:
+        """
+        Fade a device, together with the other devices started in the same window
+        :return: the group the device joined
+        """
+        forming = self._forming.get(duration)
+        if forming is None or forming[0].done:
+            if forming is not None:
+                forming[1].cancel()
+            loop = asyncio.get_running_loop()
+            group = TransitionGroup(duration, self.frame_interval)
+            self._forming[duration] = (
+                group,
+                loop.call_later(self.window, self._close, duration, group),
+            )
+            self._groups.add(group)
+            loop.call_soon(self._launch, duration, group)
+        else:
+            group = forming[0]
+        group.add(engine, base, start, end, final, on_done, easing, gamma_dpids)
+        return group
+
+    def _launch(self, duration: float, group: TransitionGroup) -> None:
+        if group._members:
+            group.start().add_done_callback(lambda _: self._groups.discard(group))
+            return
+        # everybody left before the start, later fades must not join it
+        self._groups.discard(group)
+        self._close(duration, group)
+
+    def _close(self, duration: float, group: TransitionGroup) -> None:
+        forming = self._forming.get(duration)
+        if forming is not None and forming[0] is group:
+            forming[1].cancel()
+            del self._forming[duration]
+
+    def cancel_all(self) -> None:
+        """Stop every fade, e.g. when Home Assistant shuts down."""
+        for _, handle in self._forming.values():
+            handle.cancel()
+        self._forming.clear()
+        for group in list(self._groups):
+            for engine in list(group._members):
+                engine.cancel()
+            if group._task is not None:
+                group._task.cancel()
+        self._groups.clear()
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import time
@@ -6,51 +7,174 @@ import aiohttp
 
 _LOGGER = logging.getLogger(__name__)
 
+PID_LIST_URL = "http://api-us.doiting.com/api/device_product/model"
+# a cached model list younger than this is served without asking the cloud
+PID_LIST_TTL = 7 * 24 * 3600
+# after a failed fetch, do not ask the cloud again for this long
+PID_LIST_RETRY_AFTER = 300
+PID_LIST_STORAGE_VERSION = 1
 
-def get_sn() -> str:
+
+class SnGenerator:
     """
-    message sn
-    :return: str
+    Per client message sn: the current unix time in milliseconds as a decimal
+    string, bumped past the previous value so it never repeats, even for many
+    packages built within the same millisecond.
     """
-    return str(int(round(time.time() * 1000)))
+
+    def __init__(self):
+        self._last = 0
+
+    def next(self, outstanding=()) -> str:
+        """
+        :param outstanding: sns still waiting for a reply, never handed out again
+        :return: str
+        """
+        sn = max(int(round(time.time() * 1000)), self._last + 1)
+        while str(sn) in outstanding:
+            sn += 1
+        self._last = sn
+        return str(sn)
 
 
 # cache get_pid_list result for many calls
-_CACHE_PID = []
+# lang -> {"fetched_at": float, "etag": str, "last_modified": str, "list": list}
+_CACHE_PID: dict = {}
+# Store the cache is persisted to, None keeps it in memory only
+_pid_cache_store = None
+_pid_cache_loaded = False
+# lang -> running fetch, so concurrent callers share one request
+_pid_inflight: dict = {}
+# lang -> time.time() of the last failed fetch
+_pid_failed_at: dict = {}
+
+
+def set_pid_cache_store(store) -> None:
+    """
+    Persist the get_pid_list cache, e.g. in a homeassistant.helpers.storage.Store
+    :param store: object with async_load() and async_save(data), None keeps the
+        cache in memory only
+    :return:
+    """
+    global _pid_cache_store, _pid_cache_loaded
+    if store is not _pid_cache_store:
+        _pid_cache_store = store
+        _pid_cache_loaded = False
+
+
+def pid_cache_store():
+    return _pid_cache_store
+
+
+async def _async_load_pid_cache() -> None:
+    global _pid_cache_loaded
+    if _pid_cache_loaded or _pid_cache_store is None:
+        return
+    store = _pid_cache_store
+    try:
+        data = await store.async_load()
+    except Exception as e:
+        _LOGGER.warning("Ignoring unreadable pid cache: %s", e)
+        data = None
+    if _pid_cache_loaded or store is not _pid_cache_store:
+        return
+    _pid_cache_loaded = True
+    if not isinstance(data, dict):
+        return
+    for lang, entry in data.items():
+        # a fresher in-memory entry wins over the stored one
+        if (
+            lang not in _CACHE_PID
+            and isinstance(entry, dict)
+            and isinstance(entry.get("list"), list)
+        ):
+            _CACHE_PID[lang] = entry
+
+
+async def _async_save_pid_cache() -> None:
+    if _pid_cache_store is None:
+        return
+    try:
+        await _pid_cache_store.async_save(dict(_CACHE_PID))
+    except Exception as e:
+        _LOGGER.warning("Unable to write pid cache: %s", e)
 
 
 async def get_pid_list(lang="en") -> list:
     """
     http://doc.doit/project-12/doc-95/
+    Served from cache while fresh. A stale entry is returned immediately and
+    revalidated in the background; only a cold cache waits for the cloud.
     :param lang:
     :return:
     """
-    global _CACHE_PID
-    if len(_CACHE_PID) != 0:
-        return _CACHE_PID
+    await _async_load_pid_cache()
+    entry = _CACHE_PID.get(lang)
+    if entry is not None:
+        if time.time() - entry["fetched_at"] >= PID_LIST_TTL:
+            _async_revalidate_pid_list(lang)
+        return entry["list"]
+    return await asyncio.shield(_async_revalidate_pid_list(lang))
+
+
+def _async_revalidate_pid_list(lang: str) -> asyncio.Task:
+    """Start a fetch for lang unless one is already running."""
+    task = _pid_inflight.get(lang)
+    if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.create_task(_async_fetch_pid_list(lang))
+        _pid_inflight[lang] = task
+    return task
+
+
+async def _async_fetch_pid_list(lang: str) -> list:
+    entry = _CACHE_PID.get(lang)
+    cached = entry["list"] if entry is not None else []
+
+    failed_at = _pid_failed_at.get(lang)
+    if failed_at is not None and time.time() - failed_at < PID_LIST_RETRY_AFTER:
+        return cached
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
 
-    domain = "api-us.doiting.com"
-    protocol = "http"
-    url_prefix = protocol + "://" + domain
     try:
         async with aiohttp.ClientSession() as session:
             async with session.get(
-                url_prefix + "/api/device_product/model",
+                PID_LIST_URL,
                 params={"lang": lang},
+                headers=headers,
                 timeout=aiohttp.ClientTimeout(total=3),
             ) as response:
+                if response.status == 304 and entry is not None:
+                    entry["fetched_at"] = time.time()
+                    _pid_failed_at.pop(lang, None)
+                    await _async_save_pid_cache()
+                    return cached
                 response.raise_for_status()
-                pid_list = await response.json()
-    except aiohttp.ClientError as e:
+                pid_list = await response.json(content_type=None)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         _LOGGER.error(f"Error making API request: {e}")
-        return []
+        _pid_failed_at[lang] = time.time()
+        return cached
     except json.JSONDecodeError as e:
         _LOGGER.error(f"Error decoding JSON response: {e}")
-        return []
+        _pid_failed_at[lang] = time.time()
+        return cached
 
-    if pid_list.get("ret") is None or pid_list["ret"] != "1":
+    if (
+        not isinstance(pid_list, dict)
+        or pid_list.get("ret") is None
+        or pid_list["ret"] != "1"
+    ):
         _LOGGER.info("get_pid_list.result is not as expected")
-        return []
+        _pid_failed_at[lang] = time.time()
+        return cached
 
     info = pid_list.get("info")
     if (
@@ -60,7 +184,15 @@ async def get_pid_list(lang="en") -> list:
         or not isinstance(info["list"], list)
     ):
         _LOGGER.info("get_pid_list.result structure is not as expected")
-        return []
+        _pid_failed_at[lang] = time.time()
+        return cached
 
-    _CACHE_PID = info["list"]
-    return _CACHE_PID
+    _CACHE_PID[lang] = {
+        "fetched_at": time.time(),
+        "etag": etag,
+        "last_modified": last_modified,
+        "list": info["list"],
+    }
+    _pid_failed_at.pop(lang, None)
+    await _async_save_pid_cache()
+    return info["list"]
@@ -1,58 +1,152 @@
+import argparse
 import asyncio
 import sys
 from io import StringIO
-from ipaddress import ip_address
+from ipaddress import ip_address, ip_network
 
+from custom_components.cozylife.catalog import async_refresh_from_cloud
 from custom_components.cozylife.tcp_client import tcp_client
 
+# How many addresses are probed at the same time
+DEFAULT_CONCURRENCY = 256
+# Hard deadline for connect + device_info of a single address (seconds)
+DEFAULT_PROBE_TIMEOUT = 1.0
 
-async def scan_device(ip):
-    a = tcp_client(ip, timeout=0.1)
-    await a._connect()
-    if a._writer:
-        await a._device_info()
-        return a
-    return None
-
-
-async def main():
-    def ips(start, end):
-        """Return IPs in IPv4 range, inclusive. from stackoverflow"""
-        start_int = int(ip_address(start).packed.hex(), 16)
-        end_int = int(ip_address(end).packed.hex(), 16)
-        return [ip_address(ip).exploded for ip in range(start_int, end_int + 1)]
 
-    start = "192.168.1.193"
-    end = "192.168.1.254"
+async def probe(ip, deadline=DEFAULT_PROBE_TIMEOUT, timeout=0.1):
+    """
+    Probe a single address within a hard deadline.
+    The client is always disconnected so no socket or heartbeat outlives the probe.
+    :return: tcp_client or None
+    """
+    a = tcp_client(ip, timeout=timeout)
 
-    if len(sys.argv) == 2:
-        end = sys.argv[1]
-        start = sys.argv[1]
-
-    if len(sys.argv) > 2:
-        end = sys.argv[2]
-        start = sys.argv[1]
-
-    probelist = ips(start, end)
-    print("IP scan from {0}, end with {1}".format(probelist[0], probelist[-1]))
+    async def identify():
+        await a._connect()
+        if not a._writer:
+            return None
+        await a._device_info()
+        return a if a._device_id else None
+
+    try:
+        # one deadline for both steps
+        return await asyncio.wait_for(identify(), timeout=deadline)
+    except (asyncio.TimeoutError, OSError):
+        return None
+    finally:
+        await a.disconnect()
+
+
+async def scan(ips, concurrency=DEFAULT_CONCURRENCY, deadline=DEFAULT_PROBE_TIMEOUT):
+    """
+    Probe many addresses with bounded concurrency.
+    Yields found devices as soon as they answer (streaming), in completion order.
+    :param ips: iterable of ip strings
+    :param concurrency: max number of probes in flight
+    :param deadline: per-probe deadline in seconds
+    """
+    ips = iter(ips)
+    pending = set()
+
+    def fill():
+        while len(pending) < concurrency:
+            ip = next(ips, None)
+            if ip is None:
+                return
+            pending.add(asyncio.create_task(probe(ip, deadline)))
+
+    fill()
+    while pending:
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            pending.discard(task)
+            a = task.result()
+            if a:
+                yield a
+        fill()
+
+
+def ips(start, end):
+    """Return IPs in IPv4 range, inclusive. from stackoverflow"""
+    start_int = int(ip_address(start).packed.hex(), 16)
+    end_int = int(ip_address(end).packed.hex(), 16)
+    return (ip_address(ip).exploded for ip in range(start_int, end_int + 1))
+
+
+def cidr_ips(cidr):
+    """Return host IPs of a network given in CIDR notation, e.g. 192.168.1.0/24."""
+    return (ip.exploded for ip in ip_network(cidr, strict=False).hosts())
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Scan the LAN for CozyLife devices and print a yaml config."
+    )
+    parser.add_argument(
+        "start",
+        nargs="?",
+        help="first ip of the range, or a network in CIDR notation",
+    )
+    parser.add_argument("end", nargs="?", help="last ip of the range (inclusive)")
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="max number of addresses probed at once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=DEFAULT_PROBE_TIMEOUT,
+        help="per-address deadline in seconds (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+    if args.start is not None and "/" in args.start and args.end is not None:
+        parser.error("end cannot be given with a network in CIDR notation")
+    if args.start is None:
+        args.start, args.end = "192.168.1.193", "192.168.1.254"
+    elif args.end is None and "/" not in args.start:
+        args.end = args.start
+    return args
+
+
+async def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if "/" in args.start:
+        probelist = cidr_ips(args.start)
+        print("IP scan of {0}".format(args.start))
+    else:
+        probelist = ips(args.start, args.end)
+        print("IP scan from {0}, end with {1}".format(args.start, args.end))
+
+    # merge the cloud model list once up front so models newer than the
+    # bundled model.json are named too
+    await async_refresh_from_cloud()
 
     lights_buf = StringIO()
     switches_buf = StringIO()
 
-    for ip in probelist:
-        a = await scan_device(ip)
-        if a:
-            device_info_str = f"  - ip: {ip}\n"
-            device_info_str += f"    did: {a._device_id}\n"
-            device_info_str += f"    pid: {a._pid}\n"
-            device_info_str += f"    dmn: {a._device_model_name}\n"
-            device_info_str += f"    dpid: {a._dpid}\n"
-            #  device_info_str += f'    device_type: {a._device_type_code}\n'
-
-            if a._device_type_code == "01":
-                lights_buf.write(device_info_str)
-            elif a._device_type_code == "00":
-                switches_buf.write(device_info_str)
+    async for a in scan(probelist, args.concurrency, args.timeout):
+        # stream progress to stderr so stdout stays a clean config
+        print(
+            f"found {a._ip} {a._device_model_name} ({a._device_id})",
+            file=sys.stderr,
+            flush=True,
+        )
+        device_info_str = f"  - ip: {a._ip}\n"
+        device_info_str += f"    did: {a._device_id}\n"
+        device_info_str += f"    pid: {a._pid}\n"
+        device_info_str += f"    dmn: {a._device_model_name}\n"
+        device_info_str += f"    dpid: {a._dpid}\n"
+        #  device_info_str += f'    device_type: {a._device_type_code}\n'
+
+        if a._device_type_code == "01":
+            lights_buf.write(device_info_str)
+        elif a._device_type_code == "00":
+            switches_buf.write(device_info_str)
 
     print("light:")
     print("- platform: cozylife")
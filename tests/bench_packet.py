@@ -0,0 +1,40 @@
+"""
+Micro-benchmark of the packet encoder against building every message with json.dumps.
+
+python -m tests.bench_packet
+"""
+
+import timeit
+
+from custom_components.cozylife.packet import (
+    CMD_INFO,
+    CMD_QUERY,
+    CMD_SET,
+    encode_packet,
+)
+from tests.test_packet import reference
+
+CASES = {
+    "INFO": (CMD_INFO, {}),
+    "QUERY": (CMD_QUERY, {}),
+    "SET small": (CMD_SET, {"1": 255, "2": 0, "4": 1000}),
+}
+
+
+def main(number: int = 200000) -> None:
+    for name, (cmd, payload) in CASES.items():
+        before = timeit.timeit(
+            lambda: reference(cmd, "1636463553873", payload), number=number
+        )
+        after = timeit.timeit(
+            lambda: encode_packet(cmd, "1636463553873", payload), number=number
+        )
+        print(
+            f"{name:10} json.dumps {before / number * 1e6:6.2f}us"
+            f"  encode_packet {after / number * 1e6:6.2f}us"
+            f"  x{before / after:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
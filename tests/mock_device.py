@@ -13,6 +13,13 @@ class MockCozyLifeDevice:
         self.host = host
         self.port = port
         self.server = None
+        # send a cmd 10 state report after every SET, like real firmware does
+        self.push_after_set = False
+        # stop answering requests (connections stay open)
+        self.silent = False
+        self._writers = set()
+        # every request received, in order
+        self.requests = []
         self.state: Dict[str, Any] = {
             "1": 0,  # switch
             "2": 0,  # work mode
@@ -37,22 +44,36 @@ class MockCozyLifeDevice:
     ):
         """Handle incoming TCP connection."""
         addr = writer.get_extra_info("peername")
+        self._writers.add(writer)
         _LOGGER.info(f"Connection from {addr}")
 
         try:
             while True:
-                data = await reader.read(1024)
+                data = await reader.readline()
                 if not data:
                     break
+                if not data.strip():
+                    continue
 
                 message = data.decode("utf-8").strip()
                 _LOGGER.debug(f"Received: {message}")
 
+                if self.silent:
+                    continue
+
                 try:
                     request = json.loads(message)
+                    self.requests.append(request)
                     response = await self.process_request(request)
                     response_str = json.dumps(response, separators=(",", ":")) + "\r\n"
                     writer.write(response_str.encode("utf-8"))
+                    if self.push_after_set and request.get("cmd") == 3:
+                        push = await self.process_request({"cmd": 10, "sn": "1"})
+                        writer.write(
+                            (json.dumps(push, separators=(",", ":")) + "\r\n").encode(
+                                "utf-8"
+                            )
+                        )
                     await writer.drain()
                     _LOGGER.debug(f"Sent: {response_str.strip()}")
                 except json.JSONDecodeError as e:
@@ -64,6 +85,7 @@ class MockCozyLifeDevice:
         except Exception as e:
             _LOGGER.error(f"Connection error: {e}")
         finally:
+            self._writers.discard(writer)
             writer.close()
             await writer.wait_closed()
             _LOGGER.info(f"Connection closed for {addr}")
@@ -123,6 +145,11 @@ class MockCozyLifeDevice:
             await self.server.wait_closed()
             _LOGGER.info("Mock CozyLife device stopped")
 
+    def drop_connections(self):
+        """Close all client connections, like a device losing power."""
+        for writer in list(self._writers):
+            writer.close()
+
     def set_state(self, key: str, value: Any):
         """Set device state for testing."""
         self.state[key] = value
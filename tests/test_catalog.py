@@ -0,0 +1,67 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+from custom_components.cozylife import catalog
+
+
+@pytest.fixture(autouse=True)
+def reset_index(monkeypatch):
+    """Start every test with an unloaded index."""
+    monkeypatch.setattr(catalog, "_PID_INDEX", None)
+    monkeypatch.setattr(catalog, "_load_future", None)
+    monkeypatch.setattr(catalog, "_refresh_task", None)
+
+
+def test_build_pid_index():
+    """Test flattening the model tree."""
+    index = catalog.build_pid_index(
+        [
+            {
+                "device_type_code": "00",
+                "device_model": [
+                    {
+                        "device_product_id": "abc123",
+                        "device_model_name": "Switch",
+                        "icon": "icon.png",
+                        "dpid": [1],
+                    }
+                ],
+            }
+        ]
+    )
+    assert index == {"abc123": catalog.PidInfo("00", "Switch", "icon.png", [1])}
+
+
+@pytest.mark.asyncio
+async def test_lookup_bundled_pid():
+    """Test lookup from the bundled model.json."""
+    info = await catalog.async_lookup_pid("p93sfg")
+    assert info.device_type_code == "01"
+    assert info.device_model_name == "Smart Bulb Light"
+    assert await catalog.async_lookup_pid("unknown") is None
+
+
+@pytest.mark.asyncio
+async def test_refresh_from_cloud_merges(mocker):
+    """Test cloud models are merged into the bundled index."""
+    mocker.patch(
+        "custom_components.cozylife.catalog.get_pid_list",
+        new_callable=AsyncMock,
+        return_value=[
+            {
+                "device_type_code": "00",
+                "device_model": [
+                    {
+                        "device_product_id": "new001",
+                        "device_model_name": "New Switch",
+                        "icon": "",
+                        "dpid": [1],
+                    }
+                ],
+            }
+        ],
+    )
+    assert await catalog.async_schedule_cloud_refresh()
+    assert (await catalog.async_lookup_pid("new001")).device_model_name == "New Switch"
+    assert await catalog.async_lookup_pid("p93sfg") is not None
@@ -0,0 +1,53 @@
+import colorsys
+import math
+
+import pytest
+
+from custom_components.cozylife import colors
+
+
+def ha_hs_to_rgb(h, s):
+    """homeassistant.util.color.color_hs_to_RGB"""
+    return tuple(int(round(x * 255)) for x in colorsys.hsv_to_rgb(h / 360, s / 100, 1))
+
+
+def ha_rgb_to_hs(r, g, b):
+    """homeassistant.util.color.color_RGB_to_hs"""
+    h, s, _ = colorsys.rgb_to_hsv(r / 255, g / 255, b / 255)
+    return round(h * 360, 3), round(s * 100, 3)
+
+
+def test_brightness_and_temperature_tables_match_formulas():
+    """Test every table entry equals the per-call conversion it replaces."""
+    min_mireds = math.floor(1000000 / 6500)
+    max_mireds = math.floor(1000000 / 2700)
+    ratio = (max_mireds - min_mireds) / 1000
+    assert (colors.MIN_MIREDS, colors.MAX_MIREDS) == (min_mireds, max_mireds)
+
+    for value in range(1001):
+        assert colors.brightness_from_device(value) == int(value / 1000 * 255)
+        assert colors.mireds_from_device(value) == round(max_mireds - value * ratio)
+    for brightness in range(256):
+        assert colors.brightness_to_device(brightness) == round(brightness / 255 * 1000)
+    for mireds in range(min_mireds - 5, max_mireds + 5):
+        assert colors.mireds_to_device(mireds) == 1000 - round(
+            (mireds - min_mireds) / ratio
+        )
+    for kelvin in range(2000, 7000, 7):
+        assert colors.kelvin_to_mireds(kelvin) == math.floor(1000000 / kelvin)
+
+    assert colors.mireds_from_device(65535) is None
+    assert colors.brightness_to_device(127.5) == 500
+
+
+@pytest.mark.parametrize("hue", [0, 1, 45, 120, 200, 359, 360])
+def test_hs_tables_match_rgb_round_trip(hue):
+    """Test HS conversions equal the RGB round trip through HA's colorutil."""
+    for sat in range(0, 1001, 5):
+        assert colors.hs_from_device(hue, sat) == ha_rgb_to_hs(
+            *ha_hs_to_rgb(round(hue), round(sat / 10))
+        )
+    h, s = ha_rgb_to_hs(*ha_hs_to_rgb(hue + 0.4, 55.55))
+    assert colors.hs_to_device(hue + 0.4, 55.55) == (round(h), round(s * 10))
+    # shared rows, not rebuilt per call
+    assert colors.hs_from_device(hue, 500) is colors.hs_from_device(hue, 500)
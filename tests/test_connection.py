@@ -0,0 +1,189 @@
+import asyncio
+import math
+import time
+
+import pytest
+
+import custom_components.cozylife.tcp_client as tcp_client_module
+from custom_components.cozylife.connection import (
+    BREAKER_CLOSED,
+    BREAKER_HALF_OPEN,
+    BREAKER_OPEN,
+    CircuitBreaker,
+    ConnectionManager,
+)
+from custom_components.cozylife.tcp_client import tcp_client
+
+
+@pytest.fixture
+async def manager(monkeypatch):
+    """A fast manager used by every client of the test."""
+    manager = ConnectionManager(interval=0.1, jitter=0, backoff_min=0.01)
+    monkeypatch.setattr(tcp_client_module, "get_connection_manager", lambda: manager)
+    return manager
+
+
+async def wait_until(condition, timeout=5.0):
+    """Poll condition, the timeout only guards against a hung test."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def count_pings(monkeypatch, client):
+    pings = []
+    ping = client._ping
+
+    async def counted_ping():
+        pings.append(1)
+        await ping()
+
+    monkeypatch.setattr(client, "_ping", counted_ping)
+    return pings
+
+
+@pytest.mark.asyncio
+async def test_manager_pings_idle_devices_only(mock_device, manager, monkeypatch):
+    """Test idle devices are pinged and busy devices are not."""
+    device, host, port = mock_device
+    idle = tcp_client(host, timeout=1.0)
+    idle._port = port
+    busy = tcp_client(host, timeout=1.0)
+    busy._port = port
+    await idle._connect()
+    await busy._connect()
+    assert idle in manager and busy in manager
+
+    idle_pings = count_pings(monkeypatch, idle)
+    busy_pings = count_pings(monkeypatch, busy)
+    # always heard from just now
+    busy.last_activity = math.inf
+
+    await wait_until(lambda: len(idle_pings) >= 2)
+    assert busy_pings == []
+    assert manager._task is not None and not manager._task.done()
+
+    await idle.disconnect()
+    await busy.disconnect()
+    assert idle not in manager
+    await asyncio.wait_for(manager._task, 5)
+
+
+@pytest.mark.asyncio
+async def test_manager_reconnects_dropped_device(mock_device, manager):
+    """Test a connection closed by the device is reopened."""
+    device, host, port = mock_device
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+    await client._connect()
+
+    device.drop_connections()
+    await wait_until(lambda: not client.available)
+    await wait_until(lambda: client.available)
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_manager_backs_off_unreachable_device(manager, monkeypatch):
+    """Test reconnects of an unreachable device get exponentially rarer."""
+    client = tcp_client("127.0.0.1", timeout=1.0)
+    client.breaker = CircuitBreaker(
+        failure_threshold=1, backoff_min=0.05, backoff_max=0.2
+    )
+    attempts = []
+
+    async def connect():
+        attempts.append((client.breaker.state, client.breaker._backoff))
+
+    monkeypatch.setattr(client, "_connect", connect)
+    manager.register(client)
+    await wait_until(lambda: len(attempts) >= 5)
+    manager.unregister(client)
+
+    # after the first failure only probes let through by the breaker, each
+    # after twice the previous backoff, capped
+    assert attempts[:5] == [
+        (BREAKER_CLOSED, 0.05),
+        (BREAKER_HALF_OPEN, 0.05),
+        (BREAKER_HALF_OPEN, 0.1),
+        (BREAKER_HALF_OPEN, 0.2),
+        (BREAKER_HALF_OPEN, 0.2),
+    ]
+    assert client not in manager
+
+
+def test_circuit_breaker_states():
+    """Test closed -> open -> half open -> open (longer) -> closed."""
+    breaker = CircuitBreaker(failure_threshold=2, backoff_min=10, backoff_max=25)
+    breaker.record_failure(now=0)
+    assert breaker.state == BREAKER_CLOSED and breaker.allow(now=0)
+    breaker.record_failure(now=0)
+    assert breaker.state == BREAKER_OPEN
+    assert not breaker.allow(now=5)
+    assert breaker.retry_in(now=5) == 5
+
+    # one probe only
+    assert breaker.allow(now=10)
+    assert breaker.state == BREAKER_HALF_OPEN
+    assert not breaker.allow(now=10)
+    breaker.record_failure(now=10)
+    assert breaker.retry_in(now=10) == 20
+    assert breaker.allow(now=30)
+    breaker.record_failure(now=30)
+    assert breaker.retry_in(now=30) == 25
+
+    assert breaker.allow(now=55)
+    breaker.record_success()
+    assert breaker.closed and breaker.failures == 0
+    breaker.record_failure(now=60)
+    breaker.record_failure(now=60)
+    assert breaker.retry_in(now=60) == 10
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_fails_fast():
+    """Test requests to a device behind an open breaker do not connect."""
+    client = tcp_client("127.0.0.1", timeout=1.0)
+    client._port = 1
+    client.breaker = CircuitBreaker(failure_threshold=1, backoff_min=60)
+
+    assert await client.query() is None
+    assert client.breaker.state == BREAKER_OPEN
+
+    connects = []
+    client._connect = lambda: connects.append(1)
+    assert await client.query() is None
+    assert connects == []
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_write_does_not_reconnect_through_open_breaker(monkeypatch):
+    """Test a failed write does not retry a connect the breaker refuses."""
+    client = tcp_client("127.0.0.1", timeout=1.0)
+    client.breaker = CircuitBreaker(failure_threshold=1, backoff_min=60)
+    client.breaker.record_failure()
+    attempts = []
+
+    async def connect():
+        attempts.append(True)
+
+    class BrokenWriter:
+        def write(self, data):
+            raise ConnectionResetError
+
+        def is_closing(self):
+            return False
+
+        def close(self):
+            pass
+
+        async def wait_closed(self):
+            pass
+
+    monkeypatch.setattr(client, "_connect", connect)
+    client._writer = BrokenWriter()
+
+    assert not await client._write(b"{}\r\n")
+    assert not attempts
@@ -0,0 +1,77 @@
+import logging
+
+import pytest
+
+from custom_components.cozylife.devlog import DeviceLogger, set_device_debug
+from custom_components.cozylife.tcp_client import tcp_client
+
+
+class Formatted:
+    """Argument counting how often it is formatted."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return "formatted"
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("cozylife.test_devlog")
+    logger.setLevel(logging.INFO)
+    yield logger
+    set_device_debug("10.0.0.1", False)
+    set_device_debug("did1", False)
+
+
+def test_debug_is_not_formatted_at_info(logger, caplog):
+    """Test disabled debug messages and frames cost no formatting."""
+    log = DeviceLogger(logger, "10.0.0.1")
+    arg = Formatted()
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        log.debug("value %s", arg)
+        log.frame("<-", arg)
+    assert arg.calls == 0
+    assert not caplog.records
+
+
+def test_device_debug_toggle_and_frame_sampling(logger, caplog):
+    """Test one device is debugged at INFO and its frames are sampled."""
+    log = DeviceLogger(logger, "10.0.0.1")
+    other = DeviceLogger(logger, "10.0.0.2")
+    log.did = "did1"
+    set_device_debug("did1", sample=3)
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        log.debug("value %s", 1)
+        other.debug("value %s", 2)
+        for i in range(7):
+            log.frame("<-", {"sn": i})
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages[0] == "10.0.0.1: value 1"
+    # frames 1, 4 and 7
+    assert len(messages) == 4
+    assert all(record.levelno == logging.INFO for record in caplog.records)
+
+    set_device_debug("did1", False)
+    assert not log.debug_enabled
+
+
+@pytest.mark.asyncio
+async def test_client_logs_sampled_frames(mock_device, caplog):
+    """Test the client logs both directions of a debugged device."""
+    device, host, port = mock_device
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+    set_device_debug(host, sample=1)
+    try:
+        with caplog.at_level(logging.INFO):
+            await client._connect()
+            await client.query()
+    finally:
+        set_device_debug(host, False)
+        await client.disconnect()
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(" -> frame #" in message for message in messages)
+    assert any(" <- frame #" in message for message in messages)
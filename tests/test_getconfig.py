@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+import getconfig
+from custom_components.cozylife.tcp_client import tcp_client
+
+
+@pytest.mark.asyncio
+async def test_scan_streams_found_devices(mock_device, monkeypatch):
+    """Test a device is yielded while slower probes are still running."""
+    device, host, port = mock_device
+    monkeypatch.setattr(tcp_client, "_port", port)
+    probe = getconfig.probe
+    release = asyncio.Event()
+
+    async def slow_probe(ip, deadline):
+        if ip == "127.0.0.2":
+            await release.wait()
+            return None
+        return await probe(ip, deadline)
+
+    monkeypatch.setattr(getconfig, "probe", slow_probe)
+
+    found = getconfig.scan(["127.0.0.2", host], deadline=5)
+    first = await asyncio.wait_for(found.__anext__(), 5)
+    assert first._ip == host
+    assert first._device_id == "mock_device_123"
+
+    release.set()
+    assert [a async for a in found] == []
+
+
+@pytest.mark.asyncio
+async def test_probe_deadline(monkeypatch):
+    """Test an address that accepts but never answers is given up on in time."""
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        await reader.read()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    monkeypatch.setattr(tcp_client, "_port", server.sockets[0].getsockname()[1])
+    loop = asyncio.get_running_loop()
+
+    started = loop.time()
+    # the request timeout alone would wait far longer
+    assert await getconfig.probe("127.0.0.1", deadline=0.2, timeout=30) is None
+    assert loop.time() - started < 5
+    assert connections
+
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_scan_concurrency_cap(monkeypatch):
+    """Test no more than concurrency probes are in flight."""
+    in_flight = []
+    peak = []
+
+    async def fake_probe(ip, deadline):
+        in_flight.append(ip)
+        peak.append(len(in_flight))
+        for _ in range(3):
+            await asyncio.sleep(0)
+        in_flight.remove(ip)
+        return ip if ip.endswith(".7") else None
+
+    monkeypatch.setattr(getconfig, "probe", fake_probe)
+
+    addresses = getconfig.ips("10.0.0.1", "10.0.0.10")
+    found = [a async for a in getconfig.scan(addresses, concurrency=3)]
+
+    assert found == ["10.0.0.7"]
+    assert len(peak) == 10
+    assert max(peak) == 3
+
+
+def test_ip_ranges():
+    """Test ranges are inclusive and networks expand to their hosts."""
+    assert list(getconfig.ips("192.168.1.254", "192.168.2.1")) == [
+        "192.168.1.254",
+        "192.168.1.255",
+        "192.168.2.0",
+        "192.168.2.1",
+    ]
+    assert list(getconfig.cidr_ips("192.168.1.0/30")) == [
+        "192.168.1.1",
+        "192.168.1.2",
+    ]
+    # host bits set are accepted
+    assert list(getconfig.cidr_ips("192.168.1.5/30")) == [
+        "192.168.1.5",
+        "192.168.1.6",
+    ]
+
+
+def test_parse_args():
+    """Test the address arguments and their defaults."""
+    args = getconfig.parse_args([])
+    assert (args.start, args.end) == ("192.168.1.193", "192.168.1.254")
+    args = getconfig.parse_args(["10.0.0.5"])
+    assert (args.start, args.end) == ("10.0.0.5", "10.0.0.5")
+    args = getconfig.parse_args(["10.0.0.0/24", "-c", "16", "-t", "0.5"])
+    assert (args.start, args.end) == ("10.0.0.0/24", None)
+    assert (args.concurrency, args.timeout) == (16, 0.5)
+
+
+def test_parse_args_cidr_with_end(capsys):
+    """Test an end address next to a CIDR network is rejected."""
+    with pytest.raises(SystemExit):
+        getconfig.parse_args(["10.0.0.0/24", "10.0.0.9"])
+    assert "end cannot be given" in capsys.readouterr().err
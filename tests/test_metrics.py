@@ -0,0 +1,71 @@
+import pytest
+
+from custom_components.cozylife.metrics import (
+    ClientMetrics,
+    LatencyHistogram,
+    build_diagnostics,
+)
+from custom_components.cozylife.state import WRITE_STATS
+from custom_components.cozylife.tcp_client import CMD_QUERY, CMD_SET, tcp_client
+
+
+def test_latency_histogram_buckets_and_quantiles():
+    """Test values land in their bucket and quantiles report bucket bounds."""
+    histogram = LatencyHistogram((10, 100))
+    assert histogram.quantile(0.95) == 0.0
+    for value in (5, 10, 50, 60, 500):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 2, 1]
+    assert histogram.quantile(0.5) == 100.0
+    # the open bucket reports the largest value seen
+    assert histogram.quantile(1.0) == 500
+    data = histogram.as_dict()
+    assert data["count"] == 5
+    assert data["mean_ms"] == 125.0
+    assert data["buckets"] == {"le_10": 2, "le_100": 2, "inf": 1}
+
+
+def test_client_metrics_names_commands():
+    """Test the dump uses command names and counts reconnects."""
+    metrics = ClientMetrics()
+    metrics.requests[CMD_QUERY] += 2
+    metrics.timeouts[CMD_QUERY] += 1
+    metrics.observe_request(CMD_QUERY, 12.0)
+    metrics.connects = 3
+
+    data = metrics.as_dict()
+    assert data["requests"] == {"query": 2}
+    assert data["timeouts"] == {"query": 1}
+    assert data["latency"]["query"]["count"] == 1
+    assert data["reconnects"] == 2
+
+
+@pytest.mark.asyncio
+async def test_client_counts_protocol_traffic(mock_device):
+    """Test requests, latencies, bytes and timeouts of a client are counted."""
+    device, host, port = mock_device
+    client = tcp_client(host, timeout=0.2)
+    client._port = port
+
+    await client._connect()
+    assert await client.query() is not None
+    assert await client.control({"1": 1})
+    metrics = client.metrics
+    assert metrics.connects == 1
+    assert metrics.requests[CMD_QUERY] == 1
+    assert metrics.latency[CMD_QUERY].count == 1
+    assert metrics.latency[CMD_SET].count == 1
+    assert metrics.bytes_out > 0 and metrics.bytes_in > 0
+
+    device.silent = True
+    assert await client.query() is None
+    assert metrics.timeouts[CMD_QUERY] == 1
+
+    dump = build_diagnostics([client])
+    assert dump["devices"][0]["ip"] == host
+    assert dump["devices"][0]["pending_requests"] == 0
+    assert dump["devices"][0]["timeouts"] == {"query": 1}
+    assert dump["state_writes"] == WRITE_STATS
+
+    await client.disconnect()
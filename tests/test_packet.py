@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from custom_components.cozylife.packet import (
+    CMD_INFO,
+    CMD_QUERY,
+    CMD_SET,
+    FrameDecoder,
+    encode_packet,
+)
+
+
+def reference(cmd, sn, payload):
+    """The message as the client used to build it, through json.dumps."""
+    if cmd == CMD_SET:
+        msg = {"attr": [int(item) for item in payload], "data": payload}
+    elif cmd == CMD_QUERY:
+        msg = {"attr": [0]}
+    else:
+        msg = {}
+    message = {"pv": 0, "cmd": cmd, "sn": sn, "msg": msg}
+    return (json.dumps(message, separators=(",", ":")) + "\r\n").encode()
+
+
+@pytest.mark.parametrize(
+    "cmd,payload",
+    [
+        (CMD_INFO, {}),
+        (CMD_QUERY, {}),
+        (CMD_SET, {"1": 1}),
+        (CMD_SET, {"1": 255, "2": 0, "4": 1000, "3": 500}),
+        # slow path: string and bool values
+        (CMD_SET, {"1": 255, "7": "03 0000 03E8 FFFF", "8": 500}),
+        (CMD_SET, {"1": True}),
+        # slow path: int dpids
+        (CMD_SET, {1: 1, 4: 1000}),
+        (CMD_SET, {}),
+    ],
+)
+def test_encode_packet_matches_json(cmd, payload):
+    """Test templates and the SET fast path give the same bytes as json.dumps."""
+    assert encode_packet(cmd, "1636463553873", payload) == reference(
+        cmd, "1636463553873", payload
+    )
+
+
+def test_encode_packet_invalid_cmd():
+    """Test unknown commands are rejected."""
+    with pytest.raises(Exception):
+        encode_packet(10, "1", {})
+
+
+def test_frame_decoder_split_and_coalesced():
+    """Test frames split across reads or sharing one read are all decoded."""
+    decoder = FrameDecoder()
+    assert decoder.feed(b'{"sn":"1","cmd":0') == []
+    assert decoder.feed(b'}\r\n{"sn":"2"}\r\n{"sn"') == [
+        {"sn": "1", "cmd": 0},
+        {"sn": "2"},
+    ]
+    assert decoder.feed(b':"3"}\r\n') == [{"sn": "3"}]
+    assert decoder.dropped == 0
+
+
+def test_frame_decoder_drops_garbage_and_oversized():
+    """Test bad lines are skipped without losing the frames around them."""
+    decoder = FrameDecoder(max_frame_size=32)
+    assert decoder.feed(b'not json\r\n[1]\r\n\r\n{"sn":"1"}\r\n') == [{"sn": "1"}]
+    assert decoder.dropped == 2
+
+    # an endless line is cut off and skipped up to its line end
+    assert decoder.feed(b"x" * 40) == []
+    assert decoder.feed(b"x" * 40) == []
+    assert decoder.feed(b'xx\r\n{"sn":"2"}\r\n') == [{"sn": "2"}]
+    assert decoder.dropped == 3
+    assert decoder.feed(b'{"sn":"3","pad":"' + b"y" * 40 + b'"}\r\n') == []
+    assert decoder.dropped == 4
+
+
+def test_frame_decoder_json_backend():
+    """Test a custom loads function is used."""
+    decoder = FrameDecoder(loads=json.loads)
+    assert decoder.feed(b'{"sn":"1"}\n') == [{"sn": "1"}]
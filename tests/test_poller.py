@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from custom_components.cozylife.poller import AdaptivePollSchedule, async_poll_all
+
+
+@pytest.mark.asyncio
+async def test_poll_all_concurrency_cap():
+    """Test no more than concurrency polls run at once."""
+    running = 0
+    peak = 0
+
+    async def poll(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return item * 2
+
+    results = await async_poll_all(range(20), poll, concurrency=4, timeout=1)
+
+    assert results == [item * 2 for item in range(20)]
+    assert peak == 4
+
+
+@pytest.mark.asyncio
+async def test_poll_all_laggard_only_affects_itself():
+    """Test a slow or failing device does not hold up the others."""
+
+    async def poll(item):
+        if item == "slow":
+            await asyncio.sleep(10)
+        if item == "broken":
+            raise ConnectionError
+        return item
+
+    start = time.monotonic()
+    results = await async_poll_all(
+        ["a", "slow", "broken", "b"], poll, concurrency=4, timeout=0.1
+    )
+
+    assert results == ["a", None, None, "b"]
+    assert time.monotonic() - start < 1
+
+
+def test_adaptive_schedule_backs_off_when_unchanged():
+    """Test the interval doubles up to the ceiling while nothing changes."""
+    schedule = AdaptivePollSchedule(floor=10, ceiling=60)
+    state = {"1": 1}
+
+    assert schedule.due(["bulb"], now=0) == ["bulb"]
+    schedule.record("bulb", state, now=0)
+    assert schedule.interval("bulb") == 10
+
+    intervals = []
+    for now in range(1, 6):
+        schedule.record("bulb", dict(state), now=now)
+        intervals.append(schedule.interval("bulb"))
+
+    assert intervals == [20, 40, 60, 60, 60]
+    assert schedule.due(["bulb"], now=64) == []
+    assert schedule.due(["bulb"], now=65) == ["bulb"]
+
+
+def test_adaptive_schedule_activity_resets_to_floor():
+    """Test a changed state or a poke brings the device back to the floor."""
+    schedule = AdaptivePollSchedule(floor=10, ceiling=60)
+    schedule.record("bulb", {"1": 1}, now=0)
+    schedule.record("bulb", {"1": 1}, now=10)
+    assert schedule.interval("bulb") == 20
+
+    schedule.record("bulb", {"1": 0}, now=30)
+    assert schedule.interval("bulb") == 10
+
+    schedule.record("bulb", {"1": 0}, now=40)
+    schedule.poke("bulb", now=41)
+    assert schedule.interval("bulb") == 10
+    assert schedule.due(["bulb"], now=51) == ["bulb"]
+
+
+def test_adaptive_schedule_offline_backoff():
+    """Test an unreachable device backs off and is fast again once it answers."""
+    schedule = AdaptivePollSchedule(floor=10, ceiling=300)
+    for now in range(5):
+        schedule.record("bulb", None, now=now)
+    assert schedule.interval("bulb") == 300
+
+    schedule.record("bulb", {"1": 1}, now=10)
+    assert schedule.interval("bulb") == 10
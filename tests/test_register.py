@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from custom_components.cozylife.register import BitRegister
+from custom_components.cozylife.state import SOURCE_PUSH
+from custom_components.cozylife.tcp_client import tcp_client
+
+
+def commands(device, cmd):
+    return [r for r in device.requests if r["cmd"] == cmd]
+
+
+@pytest.mark.asyncio
+async def test_bit_register_batches_rockers(mock_device):
+    """Test toggles of both rockers go out as one read-modify-write."""
+    device, host, port = mock_device
+    device.state["1"] = 0x04
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+    await client._connect()
+    register = BitRegister(client, window=0.01)
+
+    results = await asyncio.gather(
+        register.write(set_bits=0x01), register.write(set_bits=0x02)
+    )
+
+    assert results == [0x07, 0x07]
+    assert len(commands(device, 2)) == 1
+    assert [r["msg"]["data"] for r in commands(device, 3)] == [{"1": 0x07}]
+    assert device.state["1"] == 0x07
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_bit_register_blind_write_when_fresh(mock_device):
+    """Test a fresh cached value is written over without a query."""
+    device, host, port = mock_device
+    device.state["1"] = 0x03
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+    await client._connect()
+    register = BitRegister(client, window=0.01)
+    client.state.update({"1": 0x03}, SOURCE_PUSH)
+
+    # the later request wins for the same bit
+    results = await asyncio.gather(
+        register.write(set_bits=0x02),
+        register.write(clear_bits=0x02),
+        register.write(clear_bits=0x01),
+    )
+
+    assert results == [0, 0, 0]
+    assert commands(device, 2) == []
+    assert device.state["1"] == 0
+    assert register.value == 0
+
+    register.max_age = 0
+    assert await register.write(set_bits=0x01) == 0x01
+    assert len(commands(device, 2)) == 1
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_bit_register_no_write_without_current_value(mock_device, monkeypatch):
+    """Test a failed read does not write the other rockers off."""
+    device, host, port = mock_device
+    device.state["1"] = 0x03
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+    await client._connect()
+    register = BitRegister(client, window=0.01)
+
+    async def failed_query():
+        return None
+
+    monkeypatch.setattr(client, "query", failed_query)
+
+    assert await register.write(set_bits=0x04) is None
+    assert commands(device, 3) == []
+    assert device.state["1"] == 0x03
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_bit_register_cancel(mock_device):
+    """Test cancel drops the pending batch and its task."""
+    device, host, port = mock_device
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+    await client._connect()
+    register = BitRegister(client, window=0.5)
+
+    write = asyncio.create_task(register.write(set_bits=0x01))
+    await asyncio.sleep(0.01)
+    register.cancel()
+
+    assert await write is None
+    await asyncio.sleep(0)
+    assert not register._flush_tasks
+    assert commands(device, 3) == []
+    await client.disconnect()
@@ -0,0 +1,31 @@
+import pytest
+
+from custom_components.cozylife.registry import ClientRegistry
+
+
+@pytest.mark.asyncio
+async def test_registry_shares_clients_by_ip_and_did(mock_device):
+    """Test one client per device, disconnected by the last release."""
+    device, host, port = mock_device
+    registry = ClientRegistry()
+
+    light = registry.acquire(host, "did1")
+    light._port = port
+    switch = registry.acquire(host)
+    assert switch is light
+    # same device configured under another address
+    assert registry.acquire("10.0.0.9", "did1") is light
+    assert registry.acquire("10.0.0.8", "did2") is not light
+    assert len(registry) == 2
+
+    await light._connect()
+    await registry.release(light)
+    await registry.release(light)
+    assert light.available
+
+    await registry.release(light)
+    assert not light.available
+    assert len(registry) == 1
+    assert registry.acquire(host, "did1") is not light
+    # releasing a client that is gone is a no-op
+    await registry.release(light)
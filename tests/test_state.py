@@ -0,0 +1,102 @@
+import pytest
+
+from custom_components.cozylife.state import (
+    SOURCE_POLL,
+    SOURCE_PUSH,
+    SOURCE_WRITE,
+    WRITE_STATS,
+    DeviceStateStore,
+    DiffWriteMixin,
+)
+from custom_components.cozylife.tcp_client import tcp_client
+
+
+def test_state_store_freshness():
+    """Test values keep their own capture time and source."""
+    store = DeviceStateStore()
+    assert store.snapshot() is None
+    assert store.age() == float("inf")
+
+    store.update({"1": 1, "4": 500}, SOURCE_POLL, now=10)
+    store.update({"4": 700}, SOURCE_WRITE, now=12)
+    assert store.source("1") == SOURCE_POLL
+    assert store.source("4") == SOURCE_WRITE
+    assert store.age("4", now=13) == 1
+    assert store.age(now=13) == 3
+
+    assert store.get("4", max_age=2, now=13) == 700
+    assert store.get("1", max_age=2, now=13) is None
+    assert store.snapshot() == {"1": 1, "4": 700}
+    # "1" is too old for a 2 second budget
+    assert store.snapshot(max_age=2, now=13) is None
+    assert store.snapshot(max_age=5, now=13) == {"1": 1, "4": 700}
+    assert store.get("9") is None
+
+
+@pytest.mark.asyncio
+async def test_client_records_state(mock_device):
+    """Test polls, pushes and acked writes land in the store."""
+    device, host, port = mock_device
+    device.push_after_set = True
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+    await client._connect()
+
+    assert await client.control({"1": 1})
+    assert client.state.get("1") == 1
+    await client.query()
+    assert client.state.source("4") == SOURCE_POLL
+
+    # answered from the store, the device is not asked
+    queries = len([r for r in device.requests if r["cmd"] == 2])
+    assert (await client.query(max_age=60))["4"] == device.state["4"]
+    assert len([r for r in device.requests if r["cmd"] == 2]) == queries
+    assert client.state.source("1") in (SOURCE_POLL, SOURCE_PUSH)
+    await client.disconnect()
+
+
+def test_diff_write_mixin_suppresses_unchanged():
+    """Test unchanged polls are not written, availability changes are."""
+
+    class Base:
+        available = True
+        writes = 0
+
+        def async_write_ha_state(self):
+            self.writes += 1
+
+    class Entity(DiffWriteMixin, Base):
+        pass
+
+    entity = Entity()
+    before = dict(WRITE_STATS)
+    assert entity.async_write_if_changed(False)
+    assert not entity.async_write_if_changed(False)
+    assert entity.async_write_if_changed(True)
+    entity.available = False
+    assert entity.async_write_if_changed(False)
+    assert not entity.async_write_if_changed(False)
+
+    assert entity.writes == 3
+    assert entity.suppressed_writes == 2
+    assert WRITE_STATS["suppressed"] - before["suppressed"] == 2
+    assert WRITE_STATS["written"] - before["written"] == 3
+
+
+def test_diff_write_mixin_tracks_direct_writes():
+    """Test a write outside the mixin is the baseline of the next poll."""
+
+    class Base:
+        available = True
+
+        def async_write_ha_state(self):
+            pass
+
+    class Entity(DiffWriteMixin, Base):
+        pass
+
+    entity = Entity()
+    # e.g. the optimistic write of a command
+    entity.async_write_ha_state()
+    assert not entity.async_write_if_changed(False)
+    assert entity.suppressed_writes == 1
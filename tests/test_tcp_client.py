@@ -1,3 +1,4 @@
+import asyncio
 from unittest.mock import AsyncMock
 
 import pytest
@@ -42,23 +43,10 @@ async def test_tcp_client_device_info(mock_device, mocker):
     client = tcp_client(host, timeout=5.0)
     client._port = port
 
-    # Mock get_pid_list to avoid network calls
+    # The cloud must not be consulted for a pid known to model.json
     mock_pid_list = mocker.patch(
-        "custom_components.cozylife.tcp_client.get_pid_list", new_callable=AsyncMock
+        "custom_components.cozylife.catalog.get_pid_list", new_callable=AsyncMock
     )
-    mock_pid_list.return_value = [
-        {
-            "device_type_code": "01",
-            "device_model": [
-                {
-                    "device_product_id": "p93sfg",
-                    "icon": "https://example.com/icon.png",
-                    "device_model_name": "Smart Bulb Light",
-                    "dpid": [1, 2, 3, 4, 5, 6],
-                }
-            ],
-        }
-    ]
 
     await client._connect()
     await client._device_info()
@@ -66,6 +54,10 @@ async def test_tcp_client_device_info(mock_device, mocker):
     # Check that device info was set
     assert client._device_id == "mock_device_123"
     assert client._pid == "p93sfg"
+    assert client.device_type_code == "01"
+    assert client.device_model_name == "Smart Bulb Light"
+    assert client.dpid == [1, 2, 3, 4, 5, 7, 8, 9, 13, 14]
+    mock_pid_list.assert_not_called()
 
     await client.disconnect()
 
@@ -152,3 +144,161 @@ async def test_tcp_client_available(mock_device):
 
     await client.disconnect()
     assert not client.available
+
+
+@pytest.mark.asyncio
+async def test_tcp_client_unsolicited_frame_not_taken_as_reply(mock_device):
+    """Test a cmd 10 report after SET does not disturb the next reply."""
+    device, host, port = mock_device
+    device.push_after_set = True
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+
+    await client._connect()
+
+    assert await client.control({"1": 1}) is True
+    state = await client.query()
+    assert state["1"] == 1
+    assert client._pending == {}
+
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_tcp_client_device_closes_connection(mock_device):
+    """Test pending requests fail fast when the device drops the socket."""
+    device, host, port = mock_device
+    client = tcp_client(host, timeout=5.0)
+    client._port = port
+
+    await client._connect()
+    device.silent = True
+    query = asyncio.create_task(client.query())
+    await asyncio.sleep(0.05)
+    device.drop_connections()
+
+    # fails long before the 5s timeout
+    assert await asyncio.wait_for(query, timeout=1.0) is None
+    assert not client.available
+
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_tcp_client_pipelined_requests(mock_device):
+    """Test many requests in flight on one socket get their own replies."""
+    device, host, port = mock_device
+    device.push_after_set = True
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+
+    await client._connect()
+
+    results = await asyncio.gather(
+        *(client.control({"4": value}) for value in range(10, 20)),
+        *(client.query() for _ in range(10)),
+    )
+
+    assert results[:10] == [True] * 10
+    assert all(state is not None for state in results[10:])
+    assert device.get_state("4") == 19
+
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_tcp_client_push_listener(mock_device):
+    """Test cmd 10 state reports reach listeners."""
+    device, host, port = mock_device
+    device.push_after_set = True
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+    pushed = []
+    remove_listener = client.add_listener(pushed.append)
+
+    await client._connect()
+    assert await client.control({"1": 1, "4": 800}) is True
+    await asyncio.sleep(0.05)
+
+    assert pushed[-1]["1"] == 1
+    assert pushed[-1]["4"] == 800
+
+    remove_listener()
+    assert await client.control({"1": 0}) is True
+    await asyncio.sleep(0.05)
+    assert pushed[-1]["1"] == 1
+
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_tcp_client_control_coalesced(mock_device):
+    """Test a burst of controls becomes few SETs with the latest values."""
+    device, host, port = mock_device
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+
+    await client._connect()
+
+    first = asyncio.create_task(client.control_coalesced({"1": 1, "4": 1}))
+    await asyncio.sleep(0)
+    # sent while the first SET waits for its ack
+    results = await asyncio.gather(
+        *(client.control_coalesced({"4": value}) for value in range(2, 21)),
+        client.control_coalesced({"3": 700}),
+    )
+
+    assert await first
+    assert all(results)
+    sets = [request for request in device.requests if request["cmd"] == 3]
+    assert len(sets) == 2
+    assert sets[0]["msg"]["data"] == {"1": 1, "4": 1}
+    assert sets[1]["msg"]["data"] == {"4": 20, "3": 700}
+    assert device.get_state("4") == 20
+
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_tcp_client_control_nowait(mock_device):
+    """Test pipelined frames are written without waiting and acks are dropped."""
+    device, host, port = mock_device
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+    pushed = []
+    client.add_listener(pushed.append)
+
+    await client._connect()
+    for value in range(100, 1000, 100):
+        await client.control_nowait({"4": value})
+    assert client._pending == {}
+
+    assert await client.control({"4": 1000}) is True
+    assert device.get_state("4") == 1000
+    assert pushed == []
+
+    await client.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_tcp_client_concurrent_requests_connect_once(mock_device):
+    """Test requests racing on a disconnected client share one connect."""
+    device, host, port = mock_device
+    client = tcp_client(host, timeout=1.0)
+    client._port = port
+    connect = client._connect
+    connects = []
+
+    async def counted_connect():
+        connects.append(1)
+        await connect()
+
+    client._connect = counted_connect
+
+    results = await asyncio.gather(*(client.query() for _ in range(5)))
+
+    assert connects == [1]
+    assert None not in results
+    assert client.breaker.closed
+
+    await client.disconnect()
@@ -0,0 +1,240 @@
+import asyncio
+import time
+
+import pytest
+
+from custom_components.cozylife.transition import (
+    TransitionCoordinator,
+    TransitionEngine,
+    compute_frames,
+    interpolate,
+)
+
+
+def test_interpolate():
+    """Test values are interpolated per dpid and rounded."""
+    assert interpolate({"4": 0, "3": 1000}, {"4": 1000, "3": 0}, 0.25) == {
+        "4": 250,
+        "3": 750,
+    }
+
+
+@pytest.mark.asyncio
+async def test_transition_duration_independent_of_latency():
+    """Test a fade with slow acks still ends on time, skipping frames."""
+    frames = []
+
+    async def send(frame):
+        frames.append(frame)
+        await asyncio.sleep(0.05)
+
+    engine = TransitionEngine(send, frame_interval=0.01)
+    start = time.monotonic()
+    await engine.start({"1": 255}, {"4": 0}, {"4": 1000}, 0.3)
+
+    # generous upper bound, a busy test host may delay the last frame
+    assert 0.3 <= time.monotonic() - start < 1
+    # 30 frames at 0.01s did not fit in the budget, only what the device took
+    assert len(frames) < 10
+    assert frames[0] == {"1": 255, "4": 0}
+    assert frames[-1] == {"1": 255, "4": 1000}
+    assert not engine.running
+    assert engine.started_at == 0
+
+
+@pytest.mark.asyncio
+async def test_transition_start_returns_immediately_and_cancels():
+    """Test starting is non-blocking and a new fade replaces the old one."""
+    frames = []
+
+    async def send(frame):
+        frames.append(frame)
+
+    engine = TransitionEngine(send, frame_interval=0.01)
+    first = engine.start({}, {"4": 0}, {"4": 1000}, 10, final={"1": 0})
+    assert engine.running
+    assert engine.started_at > 0
+
+    await asyncio.sleep(0.03)
+    second = engine.start({}, {"4": 500}, {"4": 600}, 0.05)
+    await second
+
+    assert first.cancelled()
+    assert {"1": 0} not in frames
+    assert frames[-1] == {"4": 600}
+
+
+@pytest.mark.asyncio
+async def test_transition_confirms_only_final_frame():
+    """Test intermediate frames use send, the last one confirm, then on_done."""
+    sent = []
+    confirmed = []
+    done = []
+
+    async def send(frame):
+        sent.append(frame)
+
+    async def confirm(frame):
+        confirmed.append(frame)
+
+    async def on_done():
+        done.append(True)
+
+    engine = TransitionEngine(send, confirm, frame_interval=0.01)
+    await engine.start({}, {"4": 0}, {"4": 100}, 0.1, on_done=on_done)
+
+    assert len(sent) > 1
+    assert confirmed == [{"4": 100}]
+    assert done == [True]
+
+
+@pytest.mark.asyncio
+async def test_group_transition_in_step():
+    """Test fades started together are sent on the same ticks."""
+    coordinator = TransitionCoordinator(frame_interval=0.02, window=0.01)
+    sent = {"a": [], "b": []}
+    engines = {}
+    for name in sent:
+
+        async def send(frame, name=name):
+            sent[name].append(frame)
+
+        engines[name] = TransitionEngine(send)
+
+    group = coordinator.start(engines["a"], {}, {"4": 0}, {"4": 100}, 0.2)
+    assert coordinator.start(engines["b"], {}, {"4": 100}, {"4": 0}, 0.2) is group
+    assert engines["a"].running and engines["b"].running
+
+    await asyncio.sleep(0.05)
+    await group._task
+
+    # ticks missed on a busy host are skipped for both
+    assert len(sent["a"]) == len(sent["b"])
+    # opposite fades from the same tick always add up
+    for frame_a, frame_b in zip(sent["a"], sent["b"]):
+        assert frame_a["4"] + frame_b["4"] == 100
+    assert sent["a"][-1] == {"4": 100}
+    assert sent["b"][-1] == {"4": 0}
+    assert not engines["a"].running
+
+
+@pytest.mark.asyncio
+async def test_group_transition_member_leaves():
+    """Test cancelling one member does not stop the others."""
+    coordinator = TransitionCoordinator(frame_interval=0.02, window=0.01)
+    sent_a = []
+    sent_b = []
+
+    async def send_a(frame):
+        sent_a.append(frame)
+
+    async def send_b(frame):
+        sent_b.append(frame)
+        engine_b.cancel()
+
+    engine_a = TransitionEngine(send_a)
+    engine_b = TransitionEngine(send_b)
+    group = coordinator.start(engine_a, {}, {"4": 0}, {"4": 100}, 0.2)
+    coordinator.start(engine_b, {}, {"4": 0}, {"4": 100}, 0.2)
+
+    # the group starts on the next loop iteration
+    await asyncio.sleep(0)
+    await group._task
+
+    assert not engine_b.running
+    assert sent_a[-1] == {"4": 100}
+    assert sent_b == [{"4": 0}]
+
+
+def test_compute_frames_easing_and_gamma():
+    """Test the frame buffer follows the easing and the perceptual curve."""
+    frames = compute_frames({"1": 255}, {"4": 0, "3": 0}, {"4": 1000, "3": 1000}, 4)
+    assert len(frames) == 4
+    assert frames[0] == {"1": 255, "4": 0, "3": 0}
+    assert frames[2] == {"1": 255, "4": 500, "3": 500}
+
+    eased = compute_frames({}, {"3": 0}, {"3": 1000}, 4, easing="ease_in")
+    assert [frames.row(i)[0] for i in range(4)] == [0, 250, 500, 750]
+    assert [eased.row(i)[0] for i in range(4)] == [0, 62, 250, 562]
+
+    perceptual = compute_frames({}, {"4": 0}, {"4": 1000}, 4, gamma_dpids=("4",))
+    # dark end of the ramp gets the finer steps
+    assert [perceptual.row(i)[0] for i in range(4)] == [
+        0,
+        round(0.25**2.2 * 1000),
+        round(0.5**2.2 * 1000),
+        round(0.75**2.2 * 1000),
+    ]
+
+
+def test_compute_frames_without_numpy(monkeypatch):
+    """Test the pure Python fallback builds the same frames."""
+    import custom_components.cozylife.transition as transition
+
+    args = ({"2": 0}, {"4": 20, "5": 300}, {"4": 1000, "5": 10}, 7)
+    kwargs = {"easing": "ease_in_out", "gamma_dpids": ("4",)}
+    expected = [compute_frames(*args, **kwargs)[i] for i in range(7)]
+    monkeypatch.setattr(transition, "np", None)
+    fallback = compute_frames(*args, **kwargs)
+    assert [fallback[i] for i in range(7)] == expected
+
+
+@pytest.mark.asyncio
+async def test_group_transition_does_not_wait_for_window():
+    """Test a lone fade starts at once and a latecomer in the window joins it."""
+    coordinator = TransitionCoordinator(frame_interval=0.02, window=0.5)
+    sent = []
+
+    async def send(frame):
+        sent.append(frame)
+
+    group = coordinator.start(TransitionEngine(send), {}, {"4": 0}, {"4": 100}, 0.2)
+    # a few loop iterations, far less than the window
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert sent == [{"4": 0}]
+
+    assert coordinator.start(TransitionEngine(send), {}, {}, {}, 0.2) is group
+    await group._task
+
+
+@pytest.mark.asyncio
+async def test_group_transition_all_members_leave_before_start():
+    """Test a fade started after an emptied group is not lost with it."""
+    coordinator = TransitionCoordinator(frame_interval=0.02, window=0.5)
+    sent = []
+
+    async def send(frame):
+        sent.append(frame)
+
+    engine_a = TransitionEngine(send)
+    coordinator.start(engine_a, {}, {"4": 0}, {"4": 100}, 0.1)
+    engine_a.cancel()
+    await asyncio.sleep(0)
+
+    group = coordinator.start(TransitionEngine(send), {}, {"4": 0}, {"4": 50}, 0.1)
+    await asyncio.sleep(0)
+    assert group._task is not None
+    await group._task
+    assert sent[-1] == {"4": 50}
+
+
+@pytest.mark.asyncio
+async def test_cancel_all_stops_groups():
+    """Test cancel_all stops running fades and leaves nothing scheduled."""
+    coordinator = TransitionCoordinator(frame_interval=0.02, window=0.01)
+    sent = []
+
+    async def send(frame):
+        sent.append(frame)
+
+    engine = TransitionEngine(send)
+    group = coordinator.start(engine, {}, {"4": 0}, {"4": 100}, 10, final={"1": 0})
+    await asyncio.sleep(0.05)
+    coordinator.cancel_all()
+    await asyncio.sleep(0.05)
+
+    assert group.done
+    assert not engine.running
+    assert {"1": 0} not in sent
+    assert not coordinator._groups and not coordinator._forming
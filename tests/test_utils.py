@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from custom_components.cozylife import utils
+
+PID_LIST = [{"device_type_code": "01", "device_model": []}]
+
+
+class MemoryStore:
+    """Same interface as homeassistant.helpers.storage.Store."""
+
+    def __init__(self):
+        self.data = None
+
+    async def async_load(self):
+        return self.data
+
+    async def async_save(self, data):
+        self.data = data
+
+
+@pytest.fixture(autouse=True)
+def reset_cache(monkeypatch):
+    """Start every test with an empty, in-memory pid cache."""
+    monkeypatch.setattr(utils, "_CACHE_PID", {})
+    monkeypatch.setattr(utils, "_pid_cache_store", None)
+    monkeypatch.setattr(utils, "_pid_cache_loaded", False)
+    monkeypatch.setattr(utils, "_pid_inflight", {})
+    monkeypatch.setattr(utils, "_pid_failed_at", {})
+
+
+@pytest.fixture
+async def model_api(monkeypatch):
+    """Fixture that serves the model list and counts requests."""
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        await asyncio.sleep(0.05)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response(
+            {"ret": "1", "info": {"list": PID_LIST}}, headers={"ETag": '"v1"'}
+        )
+
+    app = web.Application()
+    app.router.add_get("/api/device_product/model", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(
+        utils, "PID_LIST_URL", f"http://127.0.0.1:{port}/api/device_product/model"
+    )
+
+    yield requests
+
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_get_pid_list_single_flight(model_api):
+    """Test concurrent callers share a single request."""
+    results = await asyncio.gather(*(utils.get_pid_list() for _ in range(50)))
+
+    assert all(result == PID_LIST for result in results)
+    assert len(model_api) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_pid_list_persisted(model_api):
+    """Test the cache survives a restart."""
+    store = MemoryStore()
+    utils.set_pid_cache_store(store)
+    assert await utils.get_pid_list() == PID_LIST
+
+    # simulate a restart
+    utils._CACHE_PID.clear()
+    utils._pid_cache_loaded = False
+
+    assert await utils.get_pid_list() == PID_LIST
+    assert len(model_api) == 1
+    assert store.data["en"]["list"] == PID_LIST
+
+
+@pytest.mark.asyncio
+async def test_get_pid_list_stale_while_revalidate(model_api):
+    """Test a stale entry is served at once and revalidated with its ETag."""
+    assert await utils.get_pid_list() == PID_LIST
+    utils._CACHE_PID["en"]["fetched_at"] = time.time() - utils.PID_LIST_TTL - 1
+
+    assert await utils.get_pid_list() == PID_LIST
+    await utils._pid_inflight["en"]
+
+    assert len(model_api) == 2
+    assert model_api[1].headers["If-None-Match"] == '"v1"'
+    assert time.time() - utils._CACHE_PID["en"]["fetched_at"] < 5
+
+
+@pytest.mark.asyncio
+async def test_get_pid_list_failure_not_retried(monkeypatch):
+    """Test a failed fetch is not retried by every caller."""
+    monkeypatch.setattr(utils, "PID_LIST_URL", "http://127.0.0.1:1/model")
+
+    assert await utils.get_pid_list() == []
+    assert "en" in utils._pid_failed_at
+    failed_at = utils._pid_failed_at["en"]
+
+    assert await utils.get_pid_list() == []
+    assert utils._pid_failed_at["en"] == failed_at
+
+
+def test_sn_generator_unique_and_increasing():
+    """Test sns built in the same millisecond never collide."""
+    generator = utils.SnGenerator()
+    sns = [int(generator.next()) for _ in range(1000)]
+
+    assert sns == sorted(set(sns))
+    assert abs(sns[0] - time.time() * 1000) < 1000
+
+
+def test_sn_generator_skips_outstanding():
+    """Test an sn still waiting for a reply is not reused."""
+    generator = utils.SnGenerator()
+    first = int(generator.next())
+    generator._last = first - 1
+
+    assert int(generator.next({str(first): None})) == first + 1